@@ -1,5 +1,15 @@
 import argparse
+import os
+import sys
+
+# Make the sibling modules importable with both "python Controller" and "python -m Controller"
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+from benchmark_data import benchmark_input_pipeline
+from benchmark_model import benchmark_model
 from pipeline import create_cropspot_pipeline
+from score_data import score_jsonl
+from serve_model import serve_model
 
 
 if __name__ == "__main__":
@@ -97,10 +107,201 @@ if __name__ == "__main__":
         default="my-deploy-key",
         help="Path to the SSH deploy key",
     )
+    parser.add_argument(
+        "--colocate_training",
+        action="store_true",
+        help="Train all backbones in one task with a shared data loader",
+    )
+    parser.add_argument(
+        "--export_quantization",
+        type=str,
+        required=False,
+        default="float16",
+        choices=["none", "float16"],
+        help="Post-training quantization of the exported TFLite model (int8 models come from the gated quantization)",
+    )
+    parser.add_argument(
+        "--int8_max_drop",
+        type=float,
+        required=False,
+        default=0.01,
+        help="Largest accepted drop in test accuracy and F1 score for publishing the int8 model",
+    )
+    parser.add_argument(
+        "--distill_student",
+        type=str,
+        required=False,
+        default=None,
+        help="Backbone of a compact student model to distil the best model into (e.g. MobileNetV2)",
+    )
+    parser.add_argument(
+        "--selection_metric",
+        type=str,
+        required=False,
+        default="accuracy",
+        choices=["accuracy", "f1", "latency_mean_ms", "latency_p95_ms", "size_mb"],
+        help="Metric the best model is selected by",
+    )
+    parser.add_argument(
+        "--max_p95_latency_ms",
+        type=float,
+        required=False,
+        default=None,
+        help="Largest accepted p95 single-image inference latency (ms) for the best model",
+    )
+    parser.add_argument(
+        "--num_parallel_trials",
+        type=int,
+        required=False,
+        default=1,
+        help="Number of Hyperband trials run at the same time on a training agent",
+    )
+    parser.add_argument(
+        "--distributed_tuning_queue",
+        type=str,
+        required=False,
+        default=None,
+        help="ClearML queue to run the hyperparameter search trials on as tasks ('local' to run them in the trainer)",
+    )
+    parser.add_argument(
+        "--warm_start_tuning",
+        action="store_true",
+        help="Only search around the best hyperparameters of the previous published models",
+    )
+    parser.add_argument(
+        "--profile_steps",
+        type=str,
+        required=False,
+        default=None,
+        help="First and last step of each final fit to capture a TensorFlow profiler trace of, as 'first,last'",
+    )
+
+    # Sub-commands besides running the pipeline
+    subparsers = parser.add_subparsers(dest="command")
+
+    serve_parser = subparsers.add_parser("serve", help="Serve a published model over HTTP")
+    serve_parser.add_argument("--model_id", type=str, required=False, default=None, help="ClearML model ID")
+    serve_parser.add_argument(
+        "--model_name",
+        type=str,
+        required=False,
+        default="cropspot_resnet_model.h5",
+        help="Published model name, used when no model ID is given",
+    )
+    serve_parser.add_argument("--host", type=str, required=False, default="0.0.0.0", help="Address to listen on")
+    serve_parser.add_argument("--port", type=int, required=False, default=8080, help="Port to listen on")
+    serve_parser.add_argument(
+        "--max_batch_size", type=int, required=False, default=32, help="Maximum number of images per prediction")
+    serve_parser.add_argument(
+        "--max_wait_ms",
+        type=float,
+        required=False,
+        default=10,
+        help="Maximum time an image waits for others to fill its batch",
+    )
+    serve_parser.add_argument(
+        "--class_names", type=str, required=False, default=None, help="Comma-separated class names in index order")
+    serve_parser.add_argument(
+        "--top_k", type=int, required=False, default=3, help="Number of most likely classes returned per image")
+
+    score_parser = subparsers.add_parser("score", help="Score a JSONL file of images with a published model")
+    score_parser.add_argument("--input", type=str, required=True, help="Input JSONL file of image paths/URIs")
+    score_parser.add_argument("--output", type=str, required=True, help="Output JSONL file of predictions")
+    score_parser.add_argument("--model_id", type=str, required=False, default=None, help="ClearML model ID")
+    score_parser.add_argument(
+        "--model_name",
+        type=str,
+        required=False,
+        default="cropspot_resnet_model.h5",
+        help="Published model name, used when no model ID is given",
+    )
+    score_parser.add_argument("--batch_size", type=int, required=False, default=64, help="Images per prediction")
+    score_parser.add_argument(
+        "--num_threads", type=int, required=False, default=None, help="Image decoding threads (default: CPU count)")
+    score_parser.add_argument(
+        "--top_k", type=int, required=False, default=3, help="Number of most likely classes listed per image")
+    score_parser.add_argument(
+        "--class_names", type=str, required=False, default=None, help="Comma-separated class names in index order")
+
+    benchmark_parser = subparsers.add_parser("benchmark", help="Benchmark the inference latency of a model")
+    benchmark_parser.add_argument("--model", type=str, required=True, help="Local .h5 model or ClearML model ID")
+    benchmark_parser.add_argument(
+        "--batch_sizes", type=str, required=False, default="1,8,32", help="Comma-separated batch sizes")
+    benchmark_parser.add_argument(
+        "--thread_counts",
+        type=str,
+        required=False,
+        default="1,0",
+        help="Comma-separated TensorFlow thread counts, 0 for TensorFlow's default",
+    )
+    benchmark_parser.add_argument(
+        "--num_runs", type=int, required=False, default=20, help="Timed batches per batch size")
+
+    input_parser = subparsers.add_parser(
+        "benchmark_input", help="Benchmark the throughput of the data path on a synthetic JPEG dataset")
+    input_parser.add_argument(
+        "--output", type=str, required=False, default="input_benchmark.json", help="Output JSON file of results")
+    input_parser.add_argument(
+        "--directory", type=str, required=False, default=None, help="Existing dataset instead of synthetic images")
+    input_parser.add_argument("--num_classes", type=int, required=False, default=4, help="Synthetic classes")
+    input_parser.add_argument(
+        "--images_per_class", type=int, required=False, default=250, help="Synthetic images per class")
+    input_parser.add_argument("--batch_size", type=int, required=False, default=64, help="Images per batch")
+    input_parser.add_argument(
+        "--num_workers", type=int, required=False, default=None, help="Worker processes (default: CPU count)")
 
     # Parse the arguments
     args = parser.parse_args()
 
+    if args.command == "serve":
+        serve_model(
+            model_id=args.model_id,
+            model_name=args.model_name,
+            project_name=args.project_name,
+            host=args.host,
+            port=args.port,
+            max_batch_size=args.max_batch_size,
+            max_wait_ms=args.max_wait_ms,
+            class_names=args.class_names.split(",") if args.class_names else None,
+            top_k=args.top_k,
+        )
+        sys.exit(0)
+
+    if args.command == "benchmark":
+        benchmark_model(
+            args.model,
+            project_name=args.project_name,
+            batch_sizes=[int(size) for size in args.batch_sizes.split(",")],
+            thread_counts=[int(count) or None for count in args.thread_counts.split(",")],
+            num_runs=args.num_runs,
+        )
+        sys.exit(0)
+
+    if args.command == "benchmark_input":
+        benchmark_input_pipeline(
+            output_path=args.output,
+            directory=args.directory,
+            num_classes=args.num_classes,
+            images_per_class=args.images_per_class,
+            batch_size=args.batch_size,
+            num_workers=args.num_workers,
+        )
+        sys.exit(0)
+
+    if args.command == "score":
+        score_jsonl(
+            input_path=args.input,
+            output_path=args.output,
+            model_id=args.model_id,
+            model_name=args.model_name,
+            project_name=args.project_name,
+            batch_size=args.batch_size,
+            num_threads=args.num_threads,
+            top_k=args.top_k,
+            class_names=args.class_names.split(",") if args.class_names else None,
+        )
+        sys.exit(0)
+
     # Call the function with the parsed arguments
     create_cropspot_pipeline(
         pipeline_name=args.pipeline_name,
@@ -116,4 +317,14 @@ if __name__ == "__main__":
         commit_message=args.commit_message,
         repo_url=args.repo_url,
         deploy_key_path=args.deploy_key_path,
+        colocate_training=args.colocate_training,
+        export_quantization=args.export_quantization,
+        int8_max_drop=args.int8_max_drop,
+        distill_student=args.distill_student,
+        selection_metric=args.selection_metric,
+        max_p95_latency_ms=args.max_p95_latency_ms,
+        num_parallel_trials=args.num_parallel_trials,
+        distributed_tuning_queue=args.distributed_tuning_queue,
+        warm_start_tuning=args.warm_start_tuning,
+        profile_steps=args.profile_steps,
     )
@@ -0,0 +1,158 @@
+from data_loader import list_image_files, image_dataset, packed_sequence, packed_dataset
+from pack_data import load_resized_image, write_shards
+from preprocess_data import validate_images
+
+
+def make_synthetic_dataset(directory, num_classes=4, images_per_class=250, image_size=(640, 480), seed=42):
+    """
+    Write a class-per-folder tree of random JPEG images, shaped like the raw CropSpot dataset.
+
+    Args:
+        directory (str): Directory to write the class folders to.
+        num_classes (int): Number of class folders.
+        images_per_class (int): Number of images per class.
+        image_size (tuple): Width and height of the images.
+        seed (int): Seed of the random pixels.
+
+    Returns:
+        Number of images written.
+    """
+    import os
+    import numpy as np
+    from PIL import Image
+
+    rng = np.random.default_rng(seed)
+    width, height = image_size
+    for class_index in range(num_classes):
+        class_dir = os.path.join(directory, f"class_{class_index}")
+        os.makedirs(class_dir, exist_ok=True)
+        for i in range(images_per_class):
+            # Smooth noise compresses roughly like a photo, unlike per-pixel noise
+            pixels = rng.integers(0, 256, size=(height // 8, width // 8, 3), dtype=np.uint8)
+            image = Image.fromarray(pixels).resize((width, height), Image.BILINEAR)
+            image.save(os.path.join(class_dir, f"image_{i:05d}.jpg"), quality=90)
+
+    return num_classes * images_per_class
+
+
+def time_batches(batches, max_batches=None):
+    """
+    Time the iteration over batches of (images, labels).
+
+    Args:
+        batches: Iterable of batches, or a Keras Sequence-like object indexed by batch.
+        max_batches (int): Number of batches to time. None for all of them.
+
+    Returns:
+        Dict with the number of batches and images, the seconds taken, batches per second and images per second.
+    """
+    import time
+
+    # Keras Sequences and directory iterators are indexed by batch; the latter repeat forever when iterated
+    if hasattr(batches, "__getitem__") and hasattr(batches, "__len__"):
+        batches = (batches[i] for i in range(len(batches)))
+
+    num_batches, num_images = 0, 0
+    start = time.perf_counter()
+    for images, _ in batches:
+        num_batches += 1
+        num_images += len(images)
+        if max_batches and num_batches >= max_batches:
+            break
+    seconds = time.perf_counter() - start
+
+    return {
+        "batches": num_batches,
+        "images": num_images,
+        "seconds": seconds,
+        "batches_per_sec": num_batches / seconds,
+        "images_per_sec": num_images / seconds,
+    }
+
+
+def benchmark_input_pipeline(output_path="input_benchmark.json", directory=None, num_classes=4, images_per_class=250,
+                             img_size=224, batch_size=64, num_workers=None):
+    """
+    Benchmark the throughput of each stage of the data path on a synthetic JPEG dataset.
+
+    Measures validation files/sec, decode+resize images/sec (single process and packed into shards) and, for
+    every loader, batches/sec over one epoch. Results are saved as JSON so that runs can be compared.
+
+    Args:
+        output_path (str): JSON file to write the results to.
+        directory (str): Existing class-per-folder dataset to use instead of a synthetic one.
+        num_classes (int): Number of classes of the synthetic dataset.
+        images_per_class (int): Number of images per class of the synthetic dataset.
+        img_size (int): Target width and height of the images.
+        batch_size (int): Number of images per batch.
+        num_workers (int): Number of worker processes for validation and packing. Defaults to the usable CPUs.
+
+    Returns:
+        Dict of the results.
+    """
+    import json
+    import os
+    import platform
+    import tempfile
+    import time
+    from keras.preprocessing.image import ImageDataGenerator
+
+    with tempfile.TemporaryDirectory() as work_dir:
+        if directory is None:
+            directory = os.path.join(work_dir, "raw")
+            print(f"Writing {num_classes * images_per_class} synthetic images...")
+            make_synthetic_dataset(directory, num_classes, images_per_class)
+
+        img_paths, labels, class_indices = list_image_files(directory)
+        results = {
+            "config": {
+                "images": len(img_paths),
+                "classes": len(class_indices),
+                "img_size": img_size,
+                "batch_size": batch_size,
+                "num_workers": num_workers,
+                "cpus": os.cpu_count(),
+                "python": platform.python_version(),
+                "time": time.strftime("%Y-%m-%dT%H:%M:%S"),
+            },
+        }
+
+        start = time.perf_counter()
+        validate_images(img_paths, num_workers=num_workers)
+        results["validation_files_per_sec"] = len(img_paths) / (time.perf_counter() - start)
+
+        start = time.perf_counter()
+        for path in img_paths:
+            load_resized_image(path, img_size)
+        results["decode_resize_images_per_sec"] = len(img_paths) / (time.perf_counter() - start)
+
+        packed_dir = os.path.join(work_dir, "packed")
+        os.makedirs(packed_dir)
+        start = time.perf_counter()
+        shards = write_shards(img_paths, labels, packed_dir, "training", img_size, 2048, num_workers=num_workers)
+        results["pack_images_per_sec"] = len(img_paths) / (time.perf_counter() - start)
+        with open(os.path.join(packed_dir, "index.json"), "w") as file:
+            json.dump({"img_size": img_size, "class_indices": class_indices, "subsets": {"training": shards}}, file)
+
+        loaders = {
+            "flow_from_directory": lambda: ImageDataGenerator(rescale=1.0 / 255).flow_from_directory(
+                directory, target_size=(img_size, img_size), batch_size=batch_size, class_mode="categorical"),
+            "image_dataset": lambda: image_dataset(directory, img_size, batch_size)[0],
+            "packed_sequence": lambda: packed_sequence(packed_dir, "training", batch_size),
+            "packed_dataset": lambda: packed_dataset(packed_dir, "training", batch_size)[0],
+        }
+        results["loaders"] = {}
+        for name, loader in loaders.items():
+            results["loaders"][name] = time_batches(loader())
+            print(f"{name}: {results['loaders'][name]['batches_per_sec']:.1f} batches/s, "
+                  f"{results['loaders'][name]['images_per_sec']:.1f} images/s")
+
+    print(f"Validation: {results['validation_files_per_sec']:.1f} files/s, "
+          f"decode+resize: {results['decode_resize_images_per_sec']:.1f} images/s, "
+          f"packing: {results['pack_images_per_sec']:.1f} images/s")
+
+    with open(output_path, "w") as file:
+        json.dump(results, file, indent=1)
+    print(f"Results saved to {output_path}")
+
+    return results
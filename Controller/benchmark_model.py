@@ -0,0 +1,138 @@
+def run_benchmark(model_path, batch_sizes=(1, 8, 32), num_threads=None, num_runs=20, num_warmup=3):
+    """
+    Benchmark the inference of a saved Keras model in the current process.
+
+    TensorFlow reads its thread settings once, so this is meant to run in a fresh process (see benchmark_model).
+
+    Args:
+        model_path (str): Path to the .h5 model.
+        batch_sizes (tuple): Batch sizes to time.
+        num_threads (int): Number of TensorFlow intra-op threads. Defaults to TensorFlow's choice.
+        num_runs (int): Number of timed batches per batch size.
+        num_warmup (int): Number of untimed batches run first per batch size.
+
+    Returns:
+        Dict with the load and first-batch times, the peak RSS and, per batch size, the p50/p95/p99 and mean latency
+        and the images per second.
+    """
+    import resource
+    import time
+    import numpy as np
+    import tensorflow as tf
+
+    if num_threads:
+        tf.config.threading.set_intra_op_parallelism_threads(int(num_threads))
+        tf.config.threading.set_inter_op_parallelism_threads(1)
+
+    start = time.perf_counter()
+    model = tf.keras.models.load_model(model_path, compile=False)
+    load_time = time.perf_counter() - start
+
+    rng = np.random.default_rng(42)
+    images = rng.integers(0, 256, size=(max(batch_sizes), *model.input_shape[1:]), dtype=np.uint8)
+
+    # The first batch includes building the graph
+    start = time.perf_counter()
+    model.predict_on_batch(images[:1])
+    warmup_time = time.perf_counter() - start
+
+    batches = {}
+    for batch_size in batch_sizes:
+        batch = images[:batch_size]
+        for _ in range(num_warmup):
+            model.predict_on_batch(batch)
+
+        latencies = []
+        for _ in range(num_runs):
+            start = time.perf_counter()
+            model.predict_on_batch(batch)
+            latencies.append((time.perf_counter() - start) * 1000)
+
+        p50, p95, p99 = np.percentile(latencies, [50, 95, 99])
+        batches[batch_size] = {
+            "latency_p50_ms": float(p50),
+            "latency_p95_ms": float(p95),
+            "latency_p99_ms": float(p99),
+            "latency_mean_ms": float(np.mean(latencies)),
+            "images_per_sec": float(batch_size * 1000 / np.mean(latencies)),
+        }
+
+    return {
+        "num_threads": num_threads,
+        "load_time_s": load_time,
+        "warmup_time_s": warmup_time,
+        # ru_maxrss is in kilobytes on Linux
+        "peak_rss_mb": resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024,
+        "batches": batches,
+    }
+
+
+def benchmark_model(model_ref, project_name="CropSpot", batch_sizes=(1, 8, 32), thread_counts=(1, None),
+                    num_runs=20, logger=None, name=None):
+    """
+    Benchmark the inference latency, throughput and memory of a model across batch sizes and thread counts.
+
+    Every thread count runs in its own process, so the thread settings apply and the peak RSS belongs to that
+    model alone.
+
+    Args:
+        model_ref (str): Path to a local .h5 model or ClearML model ID.
+        project_name (str): Name of the ClearML project.
+        batch_sizes (tuple): Batch sizes to time.
+        thread_counts (tuple): Numbers of TensorFlow threads to time; None for TensorFlow's choice.
+        num_runs (int): Number of timed batches per batch size.
+        logger: ClearML logger to report the results to.
+        name (str): Name of the model in the reports. Defaults to model_ref.
+
+    Returns:
+        List of run_benchmark results, one per thread count.
+    """
+    import os
+    from multiprocessing import get_context
+
+    if os.path.isfile(model_ref):
+        model_path = model_ref
+    else:
+        from clearml import InputModel
+
+        model_path = InputModel(model_id=model_ref).get_local_copy()
+    name = name or os.path.basename(model_ref)
+
+    results = []
+    with get_context("spawn").Pool(1, maxtasksperchild=1) as pool:
+        for num_threads in thread_counts:
+            result = pool.apply(run_benchmark, (model_path, tuple(batch_sizes), num_threads, num_runs))
+            results.append(result)
+
+            threads = num_threads or "default"
+            print(f"{name} ({threads} threads): loaded in {result['load_time_s']:.2f}s, "
+                  f"first batch {result['warmup_time_s']:.2f}s, peak RSS {result['peak_rss_mb']:.0f} MB")
+            for batch_size, stats in result["batches"].items():
+                print(f"  batch {batch_size}: p50 {stats['latency_p50_ms']:.1f} ms, "
+                      f"p95 {stats['latency_p95_ms']:.1f} ms, p99 {stats['latency_p99_ms']:.1f} ms, "
+                      f"{stats['images_per_sec']:.1f} images/s")
+
+    if logger is not None:
+        for result in results:
+            series = f"{result['num_threads'] or 'default'} threads"
+            for batch_size, stats in result["batches"].items():
+                for metric in ("latency_p50_ms", "latency_p95_ms", "latency_p99_ms", "images_per_sec"):
+                    logger.report_scalar(f"{name} {metric}", series, iteration=batch_size, value=stats[metric])
+
+        logger.report_table(
+            f"{name} benchmark",
+            "inference",
+            iteration=0,
+            table_plot=[
+                ["threads", "batch_size", "p50_ms", "p95_ms", "p99_ms", "images_per_sec", "load_time_s",
+                 "warmup_time_s", "peak_rss_mb"]
+            ] + [
+                [result["num_threads"] or "default", batch_size, stats["latency_p50_ms"], stats["latency_p95_ms"],
+                 stats["latency_p99_ms"], stats["images_per_sec"], result["load_time_s"], result["warmup_time_s"],
+                 result["peak_rss_mb"]]
+                for result in results
+                for batch_size, stats in result["batches"].items()
+            ],
+        )
+
+    return results
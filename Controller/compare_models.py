@@ -1,28 +1,119 @@
-def compare_models(model_name_1, model_score_1, model_name_2, model_score_2, model_name_3, model_score_3, project_name):
+def select_model(candidates, metric="accuracy", max_p95_latency_ms=None, max_size_mb=None, min_accuracy=None):
     """
-    Compare the three models from the pipeline.
+    Select a model according to a selection policy: the best value of one metric among the candidates that meet
+    every constraint.
+
+    If no candidate meets every constraint, the one that comes closest is selected instead of the best by the metric,
+    so that e.g. a latency limit still picks the fastest model: the fewest violated constraints, then the smallest
+    relative violation.
+
+    Args:
+        candidates (list): Dicts with the candidate's name and its metrics (see evaluate_models).
+        metric (str): Metric to optimise: "accuracy", "f1", "latency_mean_ms", "latency_p95_ms" or "size_mb".
+        max_p95_latency_ms (float): Largest accepted p95 latency in milliseconds.
+        max_size_mb (float): Largest accepted model file size in MB.
+        min_accuracy (float): Smallest accepted test accuracy.
+
+    Returns:
+        The selected candidate, the list of candidates that met the constraints, and a description of each
+        constraint the selected candidate violates.
+    """
+    # Metric name: whether larger values are better
+    metrics = {"accuracy": True, "f1": True, "latency_mean_ms": False, "latency_p95_ms": False, "size_mb": False}
+    if metric not in metrics:
+        raise ValueError(f"Unknown selection metric {metric!r}, expected one of {sorted(metrics)}")
+
+    constraints = [
+        ("latency_p95_ms", max_p95_latency_ms, lambda value, limit: value <= limit),
+        ("size_mb", max_size_mb, lambda value, limit: value <= limit),
+        ("accuracy", min_accuracy, lambda value, limit: value >= limit),
+    ]
+    # Pipeline parameters may arrive as strings, with unset limits as "" or "None"
+    constraints = [(key, float(limit), meets) for key, limit, meets in constraints if limit not in (None, "", "None")]
+    eligible = [
+        candidate
+        for candidate in candidates
+        if all(meets(candidate[key], limit) for key, limit, meets in constraints)
+    ]
+
+    def violations(candidate):
+        return [
+            (key, limit, abs(candidate[key] - limit) / max(abs(limit), 1e-9))
+            for key, limit, meets in constraints
+            if not meets(candidate[key], limit)
+        ]
+
+    if not eligible:
+        closest = min(
+            candidates,
+            key=lambda candidate: (len(violations(candidate)), sum(excess for _, _, excess in violations(candidate))),
+        )
+        violated = [f"{key} {closest[key]:.4g} (limit {limit:.4g})" for key, limit, _ in violations(closest)]
+        return closest, eligible, violated
+
+    # Ties are broken by accuracy
+    sign = 1 if metrics[metric] else -1
+    best = max(eligible, key=lambda candidate: (sign * candidate[metric], candidate["accuracy"]))
+    return best, eligible, []
+
+
+def compare_models(metrics_table, project_name, metric="accuracy", max_p95_latency_ms=None, max_size_mb=None,
+                   min_accuracy=None):
+    """
+    Compare the evaluated models from the pipeline.
+
+    Args:
+        metrics_table: Metrics of each model, as returned by evaluate_models, or a list of candidate dicts with a
+            "name" key and the same metrics.
+        project_name (str): Name of the ClearML project.
+        metric (str): Metric to optimise (see select_model).
+        max_p95_latency_ms (float): Largest accepted p95 latency in milliseconds.
+        max_size_mb (float): Largest accepted model file size in MB.
+        min_accuracy (float): Smallest accepted test accuracy.
 
     Returns:
         str
     """
+    import logging
     from clearml import Task, InputModel
 
     task = Task.init(project_name="CropSpot", task_name="Compare Models")
+    logger = task.get_logger()
+
+    if isinstance(metrics_table, dict):
+        candidates = [dict(metrics, name=name) for name, metrics in metrics_table.items()]
+    else:
+        candidates = list(metrics_table)
+
+    best, eligible, violated = select_model(candidates, metric, max_p95_latency_ms, max_size_mb, min_accuracy)
+    if violated:
+        warning = (f"No model meets the selection constraints. Selected {best['name']}, the closest to them, which "
+                   f"violates: {', '.join(violated)}.")
+        print(f"WARNING: {warning}")
+        logger.report_text(warning, level=logging.WARNING)
 
-    # Find best models based on the F1 score
-    best_model = None
-    best_score = 0
-    for model_name, model_score in zip(
-            [model_name_1, model_name_2, model_name_3], [model_score_1, model_score_2, model_score_3]):
-        if model_score > best_score:
-            best_model = model_name
-            best_score = model_score
+    columns = [
+        column
+        for column in ["accuracy", "f1", "latency_mean_ms", "latency_p95_ms", "size_mb"]
+        if column in best
+    ]
+    logger.report_table(
+        "Model selection",
+        metric,
+        iteration=0,
+        table_plot=[["model"] + columns + ["eligible", "selected"]] + [
+            [candidate["name"]] + [candidate.get(column) for column in columns]
+            + [candidate in eligible, candidate is best]
+            for candidate in candidates
+        ],
+    )
 
     # Load the best model
-    model = InputModel(name=best_model[:-3], project=project_name, only_published=True)
+    model = InputModel(model_id=best["model_id"])
     model.connect(task=task)
 
     # Print results
-    print(f'The best model is {best_model[:-3]} with a test accuracy of {best_score}.')
+    reason = "closest to the constraints" if violated else f"selected by {metric}"
+    print(f'The best model is {best["name"]} with a test accuracy of {best["accuracy"]} ({reason}).')
 
     return model.id
@@ -0,0 +1,250 @@
+def load_packed_dataset(packed_dir, subset):
+    """
+    Open one subset of a packed dataset without reading the images into memory.
+
+    Args:
+        packed_dir (str): Directory containing the packed dataset (index.json and .npy shards).
+        subset (str): "training" or "validation".
+
+    Returns:
+        Tuple of (list of memory-mapped uint8 image shards, list of label shards, class indices).
+    """
+    import json
+    import os
+    import numpy as np
+
+    with open(os.path.join(packed_dir, "index.json")) as file:
+        index = json.load(file)
+
+    shards = index["subsets"][subset]
+    images = [np.load(os.path.join(packed_dir, shard["images"]), mmap_mode="r") for shard in shards]
+    labels = [np.load(os.path.join(packed_dir, shard["labels"])) for shard in shards]
+
+    return images, labels, index["class_indices"]
+
+
+def packed_sequence(packed_dir, subset, batch_size, shuffle=True, seed=42):
+    """
+    Create a Keras Sequence that serves zero-copy batches from a packed dataset.
+
+    Every batch is a slice of one memory-mapped shard, so images are not copied or converted on the Python side and
+    several processes on one machine share the same page-cached data. Rescaling to [0, 1] is left to the model (see
+    rescaled_input). Shuffling works on a shuffled index array of batch start positions, with a random offset every
+    epoch so batch composition changes too; the pack stage already stores samples in shuffled order. The batch grid
+    of each shard wraps around its end, so the number of batches stays the same every epoch (as tf.data requires),
+    at the cost of copying the one batch per shard that wraps.
+
+    Args:
+        packed_dir (str): Directory containing the packed dataset.
+        subset (str): "training" or "validation".
+        batch_size (int): Maximum number of images per batch.
+        shuffle (bool): Whether to shuffle the batches every epoch.
+        seed (int): Seed of the shuffling.
+
+    Returns:
+        Sequence of (uint8 images, one-hot labels) batches.
+    """
+    import json
+    import os
+    import numpy as np
+    from keras.utils import Sequence
+
+    images, labels, class_indices = load_packed_dataset(packed_dir, subset)
+    num_classes = len(class_indices)
+
+    if images:
+        image_shape = images[0].shape[1:]
+    else:
+        # A subset can have no shards (e.g. with validation_split=0), which makes an empty sequence
+        with open(os.path.join(packed_dir, "index.json")) as file:
+            img_size = json.load(file)["img_size"]
+        image_shape = (img_size, img_size, 3)
+
+    # One-hot labels are tiny, so keep them in memory and slice them like the images
+    one_hot_labels = [np.eye(num_classes, dtype="float32")[shard_labels] for shard_labels in labels]
+
+    class PackedSequence(Sequence):
+        def __init__(self):
+            self.class_indices = class_indices
+            self.num_classes = num_classes
+            self.image_shape = image_shape
+            self.samples = sum(len(shard_labels) for shard_labels in labels)
+            self.rng = np.random.default_rng(seed)
+            self.on_epoch_end()
+
+        def __len__(self):
+            return len(self.batches)
+
+        def __getitem__(self, idx):
+            shard, start, stop = self.batches[self.order[idx]]
+            size = len(labels[shard])
+            if stop <= size:
+                return images[shard][start:stop], one_hot_labels[shard][start:stop]
+
+            # The batch wraps around the end of the shard
+            return (
+                np.concatenate([images[shard][start:], images[shard][:stop - size]]),
+                np.concatenate([one_hot_labels[shard][start:], one_hot_labels[shard][:stop - size]]),
+            )
+
+        def on_epoch_end(self):
+            # Shift the batch grid of every shard by a random offset, wrapping around its end, then shuffle the
+            # batch order
+            offset = int(self.rng.integers(batch_size)) if shuffle else 0
+            self.batches = []
+            for shard, shard_labels in enumerate(labels):
+                size = len(shard_labels)
+                for start in range(0, size, batch_size):
+                    begin = (start + offset) % size
+                    self.batches.append((shard, begin, begin + min(batch_size, size - start)))
+
+            self.order = np.arange(len(self.batches))
+            if shuffle:
+                self.rng.shuffle(self.order)
+
+    return PackedSequence()
+
+
+def rescaled_input(input_shape):
+    """
+    Create a model input that accepts raw [0, 255] pixels and rescales them inside the graph.
+
+    Args:
+        input_shape (tuple): Shape of one image.
+
+    Returns:
+        Tuple of (input tensor, rescaled tensor to build the rest of the model on).
+    """
+    from keras.layers import Input, Rescaling
+
+    inputs = Input(shape=input_shape)
+    return inputs, Rescaling(1.0 / 255)(inputs)
+
+
+def list_image_files(directory, validation_split=None, subset=None):
+    """
+    List the images of a class-per-folder dataset, one thread per class folder.
+
+    Args:
+        directory (str): Dataset directory with one sub-folder per class.
+        validation_split (float): Fraction of each class held out for validation. None to use all images.
+        subset (str): "training" or "validation", when validation_split is set.
+
+    Returns:
+        Tuple of (image paths, class index of each image, class indices).
+    """
+    import os
+    from concurrent.futures import ThreadPoolExecutor
+
+    classes = sorted(entry.name for entry in os.scandir(directory) if entry.is_dir())
+    class_indices = {category: index for index, category in enumerate(classes)}
+
+    def list_class(category):
+        files = sorted(
+            entry.name for entry in os.scandir(os.path.join(directory, category))
+            if entry.name.lower().endswith((".jpg", ".jpeg", ".png"))
+        )
+        # Same per-class split as flow_from_directory: the first files of each class are held out for validation
+        if validation_split:
+            split = int(validation_split * len(files))
+            files = files[:split] if subset == "validation" else files[split:]
+        return [os.path.join(directory, category, file) for file in files]
+
+    img_paths, labels = [], []
+    with ThreadPoolExecutor(max_workers=min(32, len(classes) or 1)) as executor:
+        for category, class_paths in zip(classes, executor.map(list_class, classes)):
+            img_paths.extend(class_paths)
+            labels.extend([class_indices[category]] * len(class_paths))
+
+    return img_paths, labels, class_indices
+
+
+def image_dataset(directory, img_size, batch_size, validation_split=None, subset=None, shuffle=False, seed=42,
+                  cache=None, shuffle_buffer=1024):
+    """
+    Build a tf.data pipeline over a class-per-folder image dataset.
+
+    Images are decoded and resized in parallel (AUTOTUNE) and batches are prefetched, so input and compute overlap.
+
+    Args:
+        directory (str): Dataset directory with one sub-folder per class.
+        img_size (int): Width and height the images are resized to.
+        batch_size (int): Number of images per batch.
+        validation_split (float): Fraction of each class held out for validation. None to use all images.
+        subset (str): "training" or "validation", when validation_split is set.
+        shuffle (bool): Whether to shuffle the images every epoch.
+        seed (int): Seed of the shuffling.
+        cache: None for no cache, True to cache decoded images in memory, or a file path prefix to cache them on disk.
+        shuffle_buffer (int): Number of decoded images to shuffle over when caching.
+
+    Returns:
+        Tuple of (dataset of (uint8 images, one-hot labels) batches, class index of each image in unshuffled order,
+        class indices).
+    """
+    import os
+    import tensorflow as tf
+
+    img_paths, labels, class_indices = list_image_files(directory, validation_split, subset)
+    num_classes = len(class_indices)
+
+    def load(path, label):
+        img = tf.io.decode_image(tf.io.read_file(path), channels=3, expand_animations=False)
+        # Same interpolation as flow_from_directory and the pack stage
+        img = tf.image.resize(img, (img_size, img_size), method="nearest")
+        return tf.cast(img, tf.uint8), tf.one_hot(label, num_classes)
+
+    dataset = tf.data.Dataset.from_tensor_slices((img_paths, labels))
+
+    if cache is None or cache is False:
+        # Shuffling file names is cheap, so shuffle all of them before decoding
+        if shuffle:
+            dataset = dataset.shuffle(len(img_paths), seed=seed, reshuffle_each_iteration=True)
+        dataset = dataset.map(load, num_parallel_calls=tf.data.AUTOTUNE)
+    else:
+        dataset = dataset.map(load, num_parallel_calls=tf.data.AUTOTUNE)
+        if cache is True:
+            dataset = dataset.cache()
+        else:
+            os.makedirs(os.path.dirname(cache) or ".", exist_ok=True)
+            dataset = dataset.cache(cache)
+        if shuffle:
+            dataset = dataset.shuffle(shuffle_buffer, seed=seed, reshuffle_each_iteration=True)
+
+    dataset = dataset.batch(batch_size).prefetch(tf.data.AUTOTUNE)
+
+    return dataset, labels, class_indices
+
+
+def packed_dataset(packed_dir, subset, batch_size, shuffle=True, seed=42):
+    """
+    Wrap packed_sequence in a prefetching tf.data pipeline.
+
+    Args:
+        packed_dir (str): Directory containing the packed dataset.
+        subset (str): "training" or "validation".
+        batch_size (int): Maximum number of images per batch.
+        shuffle (bool): Whether to shuffle the batches every epoch.
+        seed (int): Seed of the shuffling.
+
+    Returns:
+        Tuple of (dataset of (uint8 images, one-hot labels) batches, underlying sequence).
+    """
+    import tensorflow as tf
+
+    sequence = packed_sequence(packed_dir, subset, batch_size, shuffle=shuffle, seed=seed)
+
+    def batches():
+        for idx in range(len(sequence)):
+            yield sequence[idx]
+        sequence.on_epoch_end()
+
+    dataset = tf.data.Dataset.from_generator(
+        batches,
+        output_signature=(
+            tf.TensorSpec(shape=(None, *sequence.image_shape), dtype=tf.uint8),
+            tf.TensorSpec(shape=(None, sequence.num_classes), dtype=tf.float32),
+        ),
+    )
+    dataset = dataset.apply(tf.data.experimental.assert_cardinality(len(sequence))).prefetch(tf.data.AUTOTUNE)
+
+    return dataset, sequence
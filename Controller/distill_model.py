@@ -0,0 +1,117 @@
+from data_loader import packed_sequence
+from feature_cache import feature_dataset
+from model_evaluation import compute_metrics, report_metrics, load_test_batches, predict_batches
+from train_model import get_backbone, load_training_data, backbone_features, publish_model
+from training_profiler import training_profiler
+
+
+def distill_model(teacher_model_id, dataset_name, test_dataset, project_name, student="MobileNetV2", temperature=4.0,
+                  alpha=0.5, epochs=30, batch_size=64, dataset_id=None):
+    """
+    Distil the winning model into a compact student model and publish it as a separate model.
+
+    The student is a frozen ImageNet backbone (MobileNet-class by default) with a small head. Its backbone features
+    and the teacher's predictions are computed once over the packed dataset, and the head is trained on a mix of
+    the true labels and the teacher's temperature-softened predictions.
+
+    Args:
+        teacher_model_id (str): ClearML ID of the teacher model.
+        dataset_name (str): Name of the packed dataset.
+        test_dataset (str): Name of the test dataset.
+        project_name (str): Name of the ClearML project.
+        student (str): Backbone of the student (see get_backbone).
+        temperature (float): Softmax temperature of the distillation targets.
+        alpha (float): Weight of the true labels in the loss; the teacher's predictions get 1 - alpha.
+        epochs (int): Maximum number of training epochs.
+        batch_size (int): Number of samples per batch.
+        dataset_id (str): ID of the packed dataset, to fetch an exact version instead of the latest by name.
+
+    Returns:
+        ID of the published student model.
+    """
+    import numpy as np
+    import tensorflow as tf
+    from clearml import Task, InputModel
+    from keras.models import Model
+    from keras.layers import Input, Dense, Dropout, Activation
+    from keras.optimizers import Adam
+    from keras.callbacks import EarlyStopping, LambdaCallback
+
+    # Pipeline parameters may arrive as strings
+    temperature, alpha, epochs = float(temperature), float(alpha), int(epochs)
+
+    task = Task.init(project_name=project_name, task_name="Distill Model")
+    logger = task.get_logger()
+
+    teacher_input_model = InputModel(model_id=teacher_model_id)
+    teacher_input_model.connect(task=task)
+    teacher = tf.keras.models.load_model(teacher_input_model.get_local_copy(), compile=False)
+
+    spec = get_backbone(student)
+    data = load_training_data(dataset_name, batch_size, dataset_id=dataset_id)
+    num_classes = data["num_classes"]
+
+    # Student backbone features, cached like the trainers' features
+    extractor, features = backbone_features([spec], data)[0]
+
+    # Targets are the one-hot labels followed by the teacher's softened predictions, in the same (unshuffled) order
+    targets = {}
+    for subset, (_, labels) in features.items():
+        print(f"Computing teacher predictions for the {subset} images...")
+        teacher_probabilities = teacher.predict(packed_sequence(data["path"], subset, batch_size, shuffle=False))
+        soft_targets = tf.nn.softmax(np.log(np.clip(teacher_probabilities, 1e-7, 1.0)) / temperature).numpy()
+        targets[subset] = np.concatenate([labels, soft_targets], axis=1).astype(np.float32)
+
+    def distillation_loss(y, logits):
+        hard_targets, soft_targets = y[:, :num_classes], y[:, num_classes:]
+        hard_loss = tf.keras.losses.categorical_crossentropy(hard_targets, logits, from_logits=True)
+        soft_loss = tf.keras.losses.kl_divergence(soft_targets, tf.nn.softmax(logits / temperature))
+        return alpha * hard_loss + (1 - alpha) * temperature ** 2 * soft_loss
+
+    def accuracy(y, logits):
+        return tf.keras.metrics.categorical_accuracy(y[:, :num_classes], logits)
+
+    # Small head on the frozen student backbone, producing logits
+    inputs = Input(shape=features["training"][0].shape[1:])
+    x = Dense(256, activation="relu")(inputs)
+    x = Dropout(0.2)(x)
+    logits = Dense(num_classes)(x)
+    head = Model(inputs=inputs, outputs=logits)
+    head.compile(optimizer=Adam(learning_rate=1e-3), loss=distillation_loss, metrics=[accuracy])
+
+    profiler = training_profiler(logger)
+    head.fit(
+        profiler.wrap(feature_dataset(features["training"][0], targets["training"], batch_size, shuffle=True)),
+        epochs=epochs,
+        validation_data=feature_dataset(features["validation"][0], targets["validation"], batch_size, shuffle=False),
+        callbacks=[
+            EarlyStopping(monitor="val_accuracy", patience=5, min_delta=0.001, restore_best_weights=True),
+            LambdaCallback(
+                on_epoch_end=lambda epoch, logs: [
+                    logger.report_scalar("loss", "train", iteration=epoch, value=logs["loss"]),
+                    logger.report_scalar("accuracy", "train", iteration=epoch, value=logs["accuracy"]),
+                    logger.report_scalar("val_loss", "validation", iteration=epoch, value=logs["val_loss"]),
+                    logger.report_scalar("val_accuracy", "validation", iteration=epoch, value=logs["val_accuracy"]),
+                ]
+            ),
+            profiler,
+        ],
+    )
+
+    # Image-to-probability student, compiled with a standard loss so it loads like every other CropSpot model
+    student_model = Model(inputs=extractor.input, outputs=Activation("softmax")(head(extractor.output)))
+    student_model.compile(optimizer="adam", loss="categorical_crossentropy", metrics=["accuracy"])
+
+    # Evaluate the student next to its teacher on one decoded copy of the test set
+    batches, labels, class_names = load_test_batches(test_dataset)
+    for series, model in (("teacher", teacher), ("student", student_model)):
+        metrics = compute_metrics(labels, predict_batches(model, batches))
+        report_metrics(logger, metrics, class_names, series=series)
+        print(f"{series}: accuracy {metrics['accuracy']:.3f}, F1 {metrics['f1']:.3f}, "
+              f"{model.count_params():,} parameters")
+
+    # Named after its backbone, so students of different backbones are kept apart, and apart from that backbone's
+    # own (non-distilled) model
+    student_spec = dict(
+        spec, model_name=f"cropspot_{spec['key']}_student_model", display_name=f"{spec['display_name']} Student")
+    return publish_model(task, student_model, student_spec)
@@ -0,0 +1,171 @@
+def search_space(hypermodel):
+    """
+    Get the full search space of a hypermodel.
+
+    Args:
+        hypermodel: keras_tuner HyperModel.
+
+    Returns:
+        keras_tuner HyperParameters holding every hyperparameter of the search space.
+    """
+    from keras_tuner import HyperParameters
+
+    # Building the model once registers every hyperparameter of the search space
+    space = HyperParameters()
+    hypermodel.build(space)
+
+    return space
+
+
+def sample_configurations(hypermodel, num_configs, seed=42, hyperparameters=None):
+    """
+    Draw random configurations from a hypermodel's search space.
+
+    Args:
+        hypermodel: keras_tuner HyperModel.
+        num_configs (int): Number of configurations.
+        seed (int): Seed of the draws.
+        hyperparameters: keras_tuner HyperParameters to draw from instead of the full search space, e.g. from
+            narrowed_hyperparameters.
+
+    Returns:
+        List of dicts of hyperparameter values.
+    """
+    import random
+
+    space = hyperparameters if hyperparameters is not None else search_space(hypermodel)
+
+    rng = random.Random(seed)
+    return [{hp.name: hp.random_sample(rng.randint(0, 2**31)) for hp in space.space} for _ in range(num_configs)]
+
+
+def successive_halving(configs, run_trials, min_epochs=1, max_epochs=10, factor=3, logger=None):
+    """
+    Find the best configuration with successive halving.
+
+    All configurations are trained for min_epochs, the best 1/factor of them for factor times as many epochs, and so
+    on, until the survivors have been trained for max_epochs or only one would be left. Every rung trains its trials
+    from scratch, so trials can run anywhere.
+
+    Args:
+        configs (list): Dicts of hyperparameter values.
+        run_trials: Function taking a list of (trial ID, values, epochs) and returning a dict of trial ID to
+            val_accuracy, e.g. from local_trial_runner or clearml_trial_runner.
+        min_epochs (int): Epochs of the first rung.
+        max_epochs (int): Largest number of epochs of a trial.
+        factor (int): Reduction factor between rungs.
+        logger: ClearML logger to report the rungs to.
+
+    Returns:
+        Tuple of (best hyperparameter values, its val_accuracy).
+    """
+    trials = {f"{i:03d}": values for i, values in enumerate(configs)}
+    epochs = int(min_epochs)
+    history = []
+
+    for rung in range(len(configs)):
+        print(f"Rung {rung}: training {len(trials)} configurations for {epochs} epochs...")
+        scores = run_trials([(trial_id, values, epochs) for trial_id, values in trials.items()])
+        ranked = sorted(trials, key=lambda trial_id: scores[trial_id], reverse=True)
+        history.extend([rung, epochs, trial_id, scores[trial_id], str(trials[trial_id])] for trial_id in ranked)
+
+        if logger is not None:
+            logger.report_scalar("successive halving", "best val_accuracy", iteration=rung, value=scores[ranked[0]])
+
+        survivors = len(trials) // factor
+        if survivors <= 1 or epochs >= max_epochs:
+            break
+        trials = {trial_id: trials[trial_id] for trial_id in ranked[:survivors]}
+        epochs = min(max_epochs, epochs * factor)
+
+    if logger is not None:
+        logger.report_table(
+            "Successive halving",
+            "trials",
+            iteration=0,
+            table_plot=[["rung", "epochs", "trial", "val_accuracy", "hyperparameters"]] + history,
+        )
+
+    best = ranked[0]
+    print(f"Best configuration {best}: val_accuracy {scores[best]:.4f}, {trials[best]}")
+    return trials[best], scores[best]
+
+
+def local_trial_runner(fit_trial):
+    """
+    Run trials one after the other in this process, standing in for the agent queue.
+
+    Args:
+        fit_trial: Function taking (hyperparameter values, epochs) and returning the trial's val_accuracy.
+
+    Returns:
+        Trial runner for successive_halving.
+    """
+    def run_trials(trials):
+        return {trial_id: fit_trial(values, epochs) for trial_id, values, epochs in trials}
+
+    return run_trials
+
+
+def clearml_trial_runner(queue_name, trial_function, **trial_kwargs):
+    """
+    Run trials as child tasks of the current task on a ClearML queue, so that every free agent takes one.
+
+    Each trial is a function task calling trial_function(values=<JSON values>, epochs=<epochs>, **trial_kwargs),
+    which must report its "val_accuracy" scalar. All trials of a rung are enqueued at once and then awaited.
+
+    Args:
+        queue_name (str): Name of the ClearML queue.
+        trial_function: Function run by each trial task, defined in the current task's script (e.g. run_trial).
+        **trial_kwargs: Other arguments of trial_function.
+
+    Returns:
+        Trial runner for successive_halving.
+    """
+    import json
+    from clearml import Task
+
+    def run_trials(trials):
+        controller = Task.current_task()
+
+        tasks = {}
+        for trial_id, values, epochs in trials:
+            tasks[trial_id] = controller.create_function_task(
+                trial_function,
+                task_name=f"{controller.name} trial {trial_id} ({epochs} epochs)",
+                values=json.dumps(values),
+                epochs=epochs,
+                **trial_kwargs,
+            )
+            Task.enqueue(tasks[trial_id], queue_name=queue_name)
+        print(f"Enqueued {len(tasks)} trials on '{queue_name}'.")
+
+        scores = {}
+        for trial_id, task in tasks.items():
+            task.wait_for_status(
+                status=[Task.TaskStatusEnum.completed],
+                raise_on_status=[Task.TaskStatusEnum.failed, Task.TaskStatusEnum.stopped],
+            )
+            task.reload()
+            scores[trial_id] = task.get_last_scalar_metrics()["val_accuracy"]["validation"]["max"]
+        return scores
+
+    return run_trials
+
+
+def fixed_hyperparameters(values):
+    """
+    Turn hyperparameter values into keras_tuner HyperParameters that build exactly that configuration.
+
+    Args:
+        values (dict): Hyperparameter values.
+
+    Returns:
+        keras_tuner HyperParameters.
+    """
+    from keras_tuner import HyperParameters
+
+    hp = HyperParameters()
+    for name, value in values.items():
+        hp.Fixed(name, value)
+    return hp
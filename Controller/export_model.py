@@ -0,0 +1,153 @@
+from data_loader import load_packed_dataset
+
+
+def calibration_images(dataset_path, num_samples=200, seed=42):
+    """
+    Sample training images from a packed dataset to calibrate int8 quantization.
+
+    Args:
+        dataset_path (str): Directory containing the packed dataset.
+        num_samples (int): Number of images to sample.
+        seed (int): Seed of the sampling.
+
+    Returns:
+        float32 array of raw [0, 255] images, shape (num_samples, height, width, 3).
+    """
+    import numpy as np
+
+    images, _, _ = load_packed_dataset(dataset_path, "training")
+    rng = np.random.default_rng(seed)
+
+    locations = [(shard, offset) for shard, shard_images in enumerate(images) for offset in range(len(shard_images))]
+    picks = rng.choice(len(locations), size=min(num_samples, len(locations)), replace=False)
+
+    return np.stack([images[locations[i][0]][locations[i][1]] for i in sorted(picks)]).astype(np.float32)
+
+
+def convert_to_tflite(model, quantization=None, calibration_data=None):
+    """
+    Convert a Keras model to an inference-only TFLite flatbuffer, optionally quantized.
+
+    Args:
+        model: Keras model.
+        quantization (str): None for float32, "float16" for float16 weights, or "int8" for full integer quantization
+            of weights and activations (float input and output are kept).
+        calibration_data: Images returned by calibration_images, required for "int8".
+
+    Returns:
+        Bytes of the TFLite model.
+    """
+    import tensorflow as tf
+
+    converter = tf.lite.TFLiteConverter.from_keras_model(model)
+
+    if quantization == "float16":
+        converter.optimizations = [tf.lite.Optimize.DEFAULT]
+        converter.target_spec.supported_types = [tf.float16]
+    elif quantization == "int8":
+        if calibration_data is None:
+            raise ValueError("int8 quantization needs calibration data")
+        converter.optimizations = [tf.lite.Optimize.DEFAULT]
+        converter.representative_dataset = lambda: ([image[None]] for image in calibration_data)
+        converter.target_spec.supported_ops = [tf.lite.OpsSet.TFLITE_BUILTINS_INT8]
+    elif quantization:
+        raise ValueError(f"Unknown quantization: {quantization}")
+
+    return converter.convert()
+
+
+def load_tflite_model(model_path, num_threads=None):
+    """
+    Load a TFLite model behind the same predict_on_batch interface as a Keras model.
+
+    Args:
+        model_path (str): Path of the .tflite file.
+        num_threads (int): Number of CPU threads of the interpreter. Defaults to TFLite's choice.
+
+    Returns:
+        Model wrapper with input_shape and predict_on_batch(images).
+    """
+    import numpy as np
+    import tensorflow as tf
+
+    interpreter = tf.lite.Interpreter(model_path=model_path, num_threads=num_threads)
+    input_details = interpreter.get_input_details()[0]
+    output_details = interpreter.get_output_details()[0]
+
+    class TFLiteModel:
+        def __init__(self):
+            self.input_shape = (None, *input_details["shape"][1:])
+            self.batch_size = None
+
+        def predict_on_batch(self, images):
+            # Resizing the input re-plans the interpreter, so only do it when the batch size changes
+            if len(images) != self.batch_size:
+                interpreter.resize_tensor_input(input_details["index"], [len(images), *self.input_shape[1:]])
+                interpreter.allocate_tensors()
+                self.batch_size = len(images)
+
+            interpreter.set_tensor(input_details["index"], np.asarray(images, dtype=input_details["dtype"]))
+            interpreter.invoke()
+            return interpreter.get_tensor(output_details["index"])
+
+    return TFLiteModel()
+
+
+def export_model(model_id, project_name, quantization="float16"):
+    """
+    Export a trained model to a lean TFLite artifact and publish it as a separate ClearML model.
+
+    The optimizer state and other training-only parts of the .h5 are dropped. Int8 models are left to quantize_model,
+    which only publishes them if they pass its accuracy gate.
+
+    Args:
+        model_id (str): ClearML ID of the trained Keras model.
+        project_name (str): Name of the ClearML project.
+        quantization (str): "none" or "float16".
+
+    Returns:
+        ID of the exported model.
+    """
+    import os
+    from clearml import Task, InputModel, OutputModel
+    from keras.models import load_model
+
+    quantization = None if quantization in (None, "", "none") else quantization
+    if quantization not in (None, "float16"):
+        raise ValueError(f"Unsupported export quantization: {quantization}. Int8 models are made by quantize_model.")
+
+    task = Task.init(project_name=project_name, task_name="Export Model")
+
+    input_model = InputModel(model_id=model_id)
+    input_model.connect(task=task)
+
+    # Loading without compiling leaves the optimizer state behind
+    model = load_model(input_model.get_local_copy(), compile=False)
+
+    print(f"Converting {input_model.name} to TFLite ({quantization or 'float32'})...")
+    tflite_model = convert_to_tflite(model, quantization)
+
+    exported_model_dir = "Exported Models"
+    if not os.path.exists(exported_model_dir):
+        os.makedirs(exported_model_dir)
+
+    model_file_name = f"{input_model.name}.tflite"
+    with open(os.path.join(exported_model_dir, model_file_name), "wb") as file:
+        file.write(tflite_model)
+    print(f"Exported model size: {len(tflite_model) / 2 ** 20:.1f} MiB")
+
+    output_model = OutputModel(
+        task=task,
+        name=f"{input_model.name}_tflite",
+        framework="Tensorflow",
+        tags=["tflite", quantization or "float32"],
+    )
+
+    # Upload the exported model to ClearML
+    output_model.update_weights(
+        os.path.join(exported_model_dir, model_file_name), upload_uri="https://files.clear.ml", auto_delete_file=False)
+
+    # Make sure the model is accessible
+    output_model.publish()
+
+    return output_model.id
@@ -0,0 +1,192 @@
+from data_loader import rescaled_input
+
+
+def backbone_extractor(backbone, input_shape):
+    """
+    Build a frozen ImageNet backbone that maps raw [0, 255] images to pooled features.
+
+    Args:
+        backbone: Keras application constructor (e.g. keras.applications.ResNet50V2).
+        input_shape (tuple): Shape of one image.
+
+    Returns:
+        Frozen Keras model from images to globally average-pooled features.
+    """
+    from keras.models import Model
+    from keras.layers import GlobalAveragePooling2D
+
+    inputs, rescaled = rescaled_input(input_shape)
+    base_model = backbone(weights="imagenet", include_top=False, input_tensor=rescaled)
+
+    # Freeze the base model
+    for layer in base_model.layers:
+        layer.trainable = False
+
+    return Model(inputs=inputs, outputs=GlobalAveragePooling2D()(base_model.output), name=f"{base_model.name}_features")
+
+
+def cached_features(extractor, sequence, cache_path):
+    """
+    Compute backbone features for a dataset once and cache them on disk as float16.
+
+    Args:
+        extractor: Model returned by backbone_extractor.
+        sequence: Unshuffled packed_sequence of (images, one-hot labels) batches.
+        cache_path (str): Path of the .npy feature file. Must be unique per (backbone, dataset version, subset).
+
+    Returns:
+        Tuple of (float16 features, one-hot labels), in the order of the sequence.
+    """
+    return cached_features_multi([extractor], sequence, [cache_path])[0]
+
+
+def cached_features_multi(extractors, sequence, cache_paths):
+    """
+    Compute the features of several backbones in a single sweep over a dataset and cache them as float16.
+
+    Each batch is read once and fed to every backbone whose features are not cached yet.
+
+    Args:
+        extractors (list): Models returned by backbone_extractor.
+        sequence: Unshuffled packed_sequence of (images, one-hot labels) batches.
+        cache_paths (list): Path of the .npy feature file of each extractor.
+
+    Returns:
+        List of (float16 features, one-hot labels) tuples, one per extractor, in the order of the sequence.
+    """
+    import os
+    import numpy as np
+
+    labels = np.concatenate([sequence[idx][1] for idx in range(len(sequence))])
+
+    missing = [i for i, cache_path in enumerate(cache_paths) if not os.path.exists(cache_path)]
+    if missing:
+        print(f"Computing features of {len(missing)} backbone(s) for {sequence.samples} images...")
+        batches = {i: [] for i in missing}
+        for idx in range(len(sequence)):
+            images = sequence[idx][0]
+            for i in missing:
+                batches[i].append(extractors[i].predict_on_batch(images).astype(np.float16))
+
+        for i in missing:
+            os.makedirs(os.path.dirname(cache_paths[i]) or ".", exist_ok=True)
+            tmp_path = f"{cache_paths[i]}.tmp.npy"
+            np.save(tmp_path, np.concatenate(batches.pop(i)))
+            os.replace(tmp_path, cache_paths[i])
+
+    results = []
+    for cache_path in cache_paths:
+        print(f"Loading cached features from {cache_path}")
+        results.append((np.load(cache_path), labels))
+
+    return results
+
+
+def publish_features(features, extractor_name, dataset_id, project_name):
+    """
+    Publish a backbone's cached features and labels as a ClearML dataset, once per backbone and dataset version.
+
+    Trial tasks of a distributed search then download the features instead of running the backbone again.
+
+    Args:
+        features (dict): Subset to (features, one-hot labels), as returned by backbone_features.
+        extractor_name (str): Name of the feature extractor.
+        dataset_id (str): ID of the packed dataset the features were computed from.
+        project_name (str): Name of the ClearML project.
+
+    Returns:
+        ID of the features dataset.
+    """
+    import os
+    import numpy as np
+    from clearml import Dataset
+
+    dataset_name = f"{extractor_name}_features"
+    tags = [f"source-{dataset_id}", f"features-{extractor_name}"]
+    try:
+        return Dataset.get(
+            dataset_name=dataset_name, dataset_project=project_name, dataset_tags=tags, only_completed=True).id
+    except ValueError:
+        pass
+
+    features_dir = f"Dataset/features/{dataset_id}/{extractor_name}"
+    os.makedirs(features_dir, exist_ok=True)
+    for subset, (subset_features, labels) in features.items():
+        np.save(os.path.join(features_dir, f"{subset}_features.npy"), subset_features)
+        np.save(os.path.join(features_dir, f"{subset}_labels.npy"), labels)
+
+    dataset = Dataset.create(dataset_name=dataset_name, dataset_project=project_name, dataset_tags=tags)
+    dataset.add_files(features_dir)
+    dataset.upload()
+    dataset.finalize()
+    print(f"Published the {extractor_name} features as dataset {dataset.id}")
+
+    return dataset.id
+
+
+def load_published_features(features_dataset_id):
+    """
+    Download features published by publish_features.
+
+    Args:
+        features_dataset_id (str): ID of the features dataset.
+
+    Returns:
+        Dict of subset to (features, one-hot labels).
+    """
+    import os
+    import numpy as np
+    from clearml import Dataset
+
+    features_dir = Dataset.get(dataset_id=features_dataset_id).get_local_copy()
+    return {
+        subset: (
+            np.load(os.path.join(features_dir, f"{subset}_features.npy")),
+            np.load(os.path.join(features_dir, f"{subset}_labels.npy")),
+        )
+        for subset in ("training", "validation")
+    }
+
+
+def feature_dataset(features, labels, batch_size, shuffle=True, seed=42):
+    """
+    Build a tf.data pipeline over cached features.
+
+    Args:
+        features: Feature array returned by cached_features.
+        labels: One-hot labels returned by cached_features.
+        batch_size (int): Number of samples per batch.
+        shuffle (bool): Whether to shuffle the samples every epoch.
+        seed (int): Seed of the shuffling.
+
+    Returns:
+        Dataset of (features, one-hot labels) batches.
+    """
+    import tensorflow as tf
+
+    dataset = tf.data.Dataset.from_tensor_slices((features, labels))
+    if shuffle:
+        dataset = dataset.shuffle(len(features), seed=seed, reshuffle_each_iteration=True)
+
+    return dataset.batch(batch_size).prefetch(tf.data.AUTOTUNE)
+
+
+def assemble_model(extractor, head_model):
+    """
+    Stack a head trained on cached features onto its backbone, giving one image-to-prediction model.
+
+    Args:
+        extractor: Model returned by backbone_extractor.
+        head_model: Compiled model trained on the extractor's features.
+
+    Returns:
+        Compiled Keras model from raw [0, 255] images to class probabilities.
+    """
+    from keras.models import Model
+
+    model = Model(inputs=extractor.input, outputs=head_model(extractor.output))
+
+    # The backbone is frozen, so the trainable weights and optimizer state are the head's
+    model.compile(optimizer=head_model.optimizer, loss=head_model.loss, metrics=["accuracy"])
+
+    return model
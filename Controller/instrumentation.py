@@ -0,0 +1,128 @@
+def track_phase(name, logger=None, phases=None):
+    """
+    Record the cost of one phase of a step, as a context manager or decorator.
+
+    Records the wall time, the CPU time (including finished worker processes), the peak RSS so far (of this process
+    or its workers), the bytes read and written by this process and, when the phase sets record["items"], the items
+    per second. The record is appended to phases and reported to the logger when the phase ends.
+
+    Example:
+        with track_phase("validation", logger, phases) as record:
+            records = validate_images(img_paths)
+            record["items"] = len(records)
+
+    Args:
+        name (str): Name of the phase.
+        logger: ClearML logger to report the record to.
+        phases (list): List to append the record to, e.g. for report_phases.
+
+    Returns:
+        Context manager yielding the phase record.
+    """
+    import os
+    import resource
+    import time
+    from contextlib import ContextDecorator
+    import psutil
+
+    def io_bytes():
+        try:
+            counters = psutil.Process().io_counters()
+            return counters.read_bytes, counters.write_bytes
+        except (AttributeError, psutil.Error):
+            # Not available on every platform
+            return 0, 0
+
+    class Phase(ContextDecorator):
+        def __enter__(self):
+            self.record = {"phase": name, "items": None}
+            self.io = io_bytes()
+            self.cpu = sum(os.times()[:4])
+            self.start = time.perf_counter()
+            return self.record
+
+        def __exit__(self, *exc_info):
+            wall_time = time.perf_counter() - self.start
+            read_bytes, written_bytes = io_bytes()
+            # ru_maxrss is in kilobytes on Linux
+            peak_rss = max(
+                resource.getrusage(who).ru_maxrss for who in (resource.RUSAGE_SELF, resource.RUSAGE_CHILDREN))
+
+            items = self.record["items"]
+            self.record.update({
+                "wall_time_s": wall_time,
+                "cpu_time_s": sum(os.times()[:4]) - self.cpu,
+                "peak_rss_mb": peak_rss / 1024,
+                "read_mb": (read_bytes - self.io[0]) / 2**20,
+                "written_mb": (written_bytes - self.io[1]) / 2**20,
+                "items_per_sec": items / wall_time if items and wall_time > 0 else None,
+            })
+            print(f"Phase '{name}': {wall_time:.1f}s wall, {self.record['cpu_time_s']:.1f}s CPU, "
+                  f"peak RSS {self.record['peak_rss_mb']:.0f} MB" + (f", {items} items" if items else ""))
+
+            if phases is not None:
+                phases.append(dict(self.record))
+            if logger is not None:
+                for column in ("wall_time_s", "cpu_time_s", "peak_rss_mb", "read_mb", "written_mb", "items_per_sec"):
+                    if self.record[column] is not None:
+                        logger.report_scalar(f"phase {column}", name, iteration=0, value=self.record[column])
+            return False
+
+    return Phase()
+
+
+def report_phases(task, phases):
+    """
+    Report the phase records of a step as a table and upload them as the "phases" artifact for the pipeline summary.
+
+    Args:
+        task: ClearML task of the step.
+        phases (list): Phase records from track_phase.
+    """
+    columns = ["wall_time_s", "cpu_time_s", "peak_rss_mb", "read_mb", "written_mb", "items", "items_per_sec"]
+    task.get_logger().report_table(
+        "Phases",
+        "summary",
+        iteration=0,
+        table_plot=[["phase"] + columns] + [
+            [phase["phase"]] + [phase[column] for column in columns] for phase in phases
+        ],
+    )
+    task.upload_artifact("phases", artifact_object=phases)
+
+
+def usable_cpus():
+    """
+    Get the number of CPUs this process may run on, which can be fewer than the machine has (e.g. in a container).
+
+    Returns:
+        Number of usable CPUs.
+    """
+    import os
+
+    return len(os.sched_getaffinity(0)) if hasattr(os, "sched_getaffinity") else os.cpu_count() or 1
+
+
+def phase_summary_callback():
+    """
+    Create a pipeline post-execute callback that gathers the "phases" artifact of every finished step into one
+    summary table on the pipeline task.
+
+    Returns:
+        Callback for add_function_step's post_execute_callback.
+    """
+    from clearml import Task
+
+    columns = ["wall_time_s", "cpu_time_s", "peak_rss_mb", "read_mb", "written_mb", "items", "items_per_sec"]
+    rows = []
+
+    def report_step_phases(pipeline, node):
+        artifact = Task.get_task(task_id=node.executed).artifacts.get("phases")
+        if artifact is None:
+            return
+
+        rows.extend([node.name, phase["phase"]] + [phase[column] for column in columns] for phase in artifact.get())
+        pipeline.get_logger().report_table(
+            "Pipeline phases", "summary", iteration=0, table_plot=[["step", "phase"] + columns] + rows)
+
+    return report_step_phases
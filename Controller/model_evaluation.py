@@ -1,80 +1,86 @@
-def evaluate_model(model_name, test_dataset, task_name, project_name):
-    import os
-    from clearml import Task, Dataset, InputModel
+from benchmark_model import benchmark_model
+from data_loader import image_dataset
+from instrumentation import track_phase, report_phases
+
+
+def compute_metrics(y_true, predictions):
+    """
+    Compute all evaluation metrics from one set of predicted class probabilities.
+
+    Args:
+        y_true: True class index of each image.
+        predictions: Predicted class probabilities, shape (images, classes), aligned with y_true.
+
+    Returns:
+        Dict with the loss, accuracy, macro F1 score, confusion matrix and per-class ROC curves and AUC.
+    """
     import numpy as np
-    import matplotlib.pyplot as plt
-    import seaborn as sns
-    from keras.preprocessing.image import ImageDataGenerator
-    from keras.models import Model, load_model
     from sklearn.metrics import f1_score, confusion_matrix, roc_curve, auc
-    from sklearn.preprocessing import label_binarize
-    from itertools import cycle
-    from math import ceil
 
-    task = Task.init(project_name="CropSpot", task_name=task_name)
+    y_true = np.asarray(y_true)
+    predictions = np.asarray(predictions, dtype=np.float64)
+    num_classes = predictions.shape[1]
+    y_pred = np.argmax(predictions, axis=1)
 
-    # Load the model
-    input_model = InputModel(name=model_name[:-3], project=project_name, only_published=True)
-    input_model.connect(task=task)
-    local_model = input_model.get_local_copy()
-    model = load_model(local_model)
+    # Categorical cross-entropy, clipped like Keras does
+    true_probabilities = np.clip(predictions[np.arange(len(y_true)), y_true], 1e-7, 1.0 - 1e-7)
 
-    dataset = Dataset.get(dataset_name=test_dataset)
+    roc = {}
+    for i in range(num_classes):
+        fpr, tpr, _ = roc_curve(y_true == i, predictions[:, i])
+        roc[i] = {"fpr": fpr, "tpr": tpr, "auc": auc(fpr, tpr)}
 
-    # Check if the dataset is already downloaded. If not, download it. Otherwise, use the existing dataset.
-    dataset_path = f"Dataset/{test_dataset}"
-    if not os.path.exists(dataset_path):
-        dataset.get_mutable_local_copy(dataset_path)
+    return {
+        "loss": float(-np.mean(np.log(true_probabilities))),
+        "accuracy": float(np.mean(y_pred == y_true)),
+        "f1": float(f1_score(y_true, y_pred, average="macro")),
+        "confusion_matrix": confusion_matrix(y_true, y_pred, labels=np.arange(num_classes)),
+        "roc": roc,
+    }
 
-    img_size = 224
 
-    batch_size = 64
+def report_metrics(logger, metrics, class_names, iteration=0, series="test"):
+    """
+    Report evaluation metrics to ClearML.
 
-    # Data generator for evaluation
-    test_datagen = ImageDataGenerator(rescale=1.0 / 255)
-    test_generator = test_datagen.flow_from_directory(
-        dataset_path, target_size=(img_size, img_size), batch_size=batch_size, class_mode="categorical", shuffle=True)
+    Args:
+        logger: ClearML logger.
+        metrics (dict): Metrics returned by compute_metrics.
+        class_names (list): Name of each class, in class index order.
+        iteration (int): Iteration to report the scalars at.
+        series (str): Series the metrics are reported under, e.g. the model name.
+    """
+    from itertools import cycle
+    import matplotlib.pyplot as plt
 
-    # Calculate the correct number of steps per epoch
-    steps = ceil(test_generator.samples / test_generator.batch_size)
+    logger.report_scalar("test loss", series, iteration=iteration, value=metrics["loss"])
+    logger.report_scalar("test accuracy", series, iteration=iteration, value=metrics["accuracy"])
+    logger.report_scalar("test f1", series, iteration=iteration, value=metrics["f1"])
+    for i, class_name in enumerate(class_names):
+        logger.report_scalar(f"test auc ({series})", class_name, iteration=iteration, value=metrics["roc"][i]["auc"])
 
-    # Generate predictions
-    predictions = model.predict(test_generator, steps=steps)
-    y_pred = np.argmax(predictions, axis=1)
-    y_true = test_generator.classes[: len(y_pred)]
-
-    # Evaluate the model
-    score = model.evaluate(test_generator)
-    print(f"Test loss: {score[0]:.3f}")
-    print(f"Test accuracy: {score[1]:.3f}")
-
-    # Printing the f1 score
-    f1 = f1_score(y_true, y_pred, average="macro")
-    print(f"F1 Score: {f1}")
-
-    # Plotting the confusion matrix
-    cm = confusion_matrix(y_true, y_pred)
-    sns.heatmap(cm, annot=True, fmt="d")
-    plt.xlabel("Predicted labels")
-    plt.ylabel("True labels")
-    plt.title("Confusion Matrix")
-    plt.show()
-
-    # Prepare for ROC curve plot
-    y_test_binarized = label_binarize(y_true, classes=np.arange(test_generator.num_classes))
-    n_classes = y_test_binarized.shape[1]
-    fpr, tpr, roc_auc = dict(), dict(), dict()
+    logger.report_confusion_matrix(
+        "Confusion Matrix",
+        series,
+        iteration=iteration,
+        matrix=metrics["confusion_matrix"],
+        xaxis="Predicted labels",
+        yaxis="True labels",
+        xlabels=class_names,
+        ylabels=class_names,
+    )
+
+    # Plotting the ROC curves
+    figure = plt.figure()
     colors = cycle(["blue", "red", "green"])
-    plt.figure()
-    for i, color in zip(range(n_classes), colors):
-        fpr[i], tpr[i], _ = roc_curve(y_test_binarized[:, i], predictions[:, i])
-        roc_auc[i] = auc(fpr[i], tpr[i])
+    for i, color in zip(range(len(class_names)), colors):
+        roc = metrics["roc"][i]
         plt.plot(
-            fpr[i],
-            tpr[i],
+            roc["fpr"],
+            roc["tpr"],
             color=color,
             lw=2,
-            label="ROC curve of class {0} (area = {1:0.2f})".format(i, roc_auc[i])
+            label="ROC curve of {0} (area = {1:0.2f})".format(class_names[i], roc["auc"])
         )
 
     plt.plot([0, 1], [0, 1], "k--", lw=2)
@@ -84,6 +90,169 @@ def evaluate_model(model_name, test_dataset, task_name, project_name):
     plt.ylabel("True Positive Rate")
     plt.title("Multi-class ROC")
     plt.legend(loc="lower right")
-    plt.show()
+    logger.report_matplotlib_figure("Multi-class ROC", series, figure=figure, iteration=iteration, report_image=True)
+    plt.close(figure)
+
+
+def load_input_model(model_ref, project_name, task):
+    """
+    Fetch a published model by file name or by ID.
+
+    Args:
+        model_ref (str): Model file name (e.g. cropspot_resnet_model.h5) or ClearML model ID.
+        project_name (str): Name of the ClearML project the named models are published in.
+        task: ClearML task to connect the model to.
+
+    Returns:
+        Tuple of (model ID, local path of the model file).
+    """
+    from clearml import InputModel
+
+    if model_ref.endswith(".h5"):
+        input_model = InputModel(name=model_ref[:-3], project=project_name, only_published=True)
+    else:
+        input_model = InputModel(model_id=model_ref)
+    input_model.connect(task=task)
+
+    return input_model.id, input_model.get_local_copy()
+
+
+def load_test_batches(test_dataset, img_size=224, batch_size=64):
+    """
+    Decode the test dataset once into in-memory batches.
+
+    Args:
+        test_dataset (str): Name of the test dataset.
+        img_size (int): Width and height the images are resized to.
+        batch_size (int): Number of images per batch.
+
+    Returns:
+        Tuple of (list of uint8 image batches, class index of each image, class names in class index order).
+    """
+    import os
+    from clearml import Dataset
+
+    dataset = Dataset.get(dataset_name=test_dataset)
+
+    # Check if the dataset is already downloaded. If not, download it. Otherwise, use the existing dataset.
+    dataset_path = f"Dataset/{test_dataset}"
+    if not os.path.exists(dataset_path):
+        dataset.get_mutable_local_copy(dataset_path)
+
+    # Unshuffled, so the batches line up with the labels. The batches are kept in memory below, so the decoded
+    # images are not cached on disk (an interrupted run would leave a locked, partial cache behind).
+    test_generator, labels, class_indices = image_dataset(dataset_path, img_size, batch_size, shuffle=False)
+    batches = [images.numpy() for images, _ in test_generator]
+
+    return batches, labels, sorted(class_indices, key=class_indices.get)
+
+
+def predict_batches(model, batches):
+    """
+    Run one inference sweep of a model over decoded batches.
+
+    Args:
+        model: Keras model, or any model with predict_on_batch (e.g. from load_tflite_model).
+        batches (list): Image batches returned by load_test_batches.
+
+    Returns:
+        Predicted class probabilities of all images.
+    """
+    import numpy as np
+
+    return np.concatenate([np.asarray(model.predict_on_batch(images)) for images in batches])
+
+
+def evaluate_models(model_names, test_dataset, project_name, max_concurrent_models=None):
+    """
+    Evaluate several published models against one decoded copy of the test dataset.
+
+    The test images are decoded once into in-memory batches, then every model is scored over them, several at a
+    time when memory allows. Evaluation cost therefore grows with model inference only. Each model is then
+    benchmarked on its own (see benchmark_model), so that the timings do not compete for the CPU.
+
+    Args:
+        model_names: Model file names or ClearML model IDs, as a list or a comma-separated string.
+        test_dataset (str): Name of the test dataset.
+        project_name (str): Name of the ClearML project.
+        max_concurrent_models (int): Number of models scored at the same time. Defaults to as many as fit in the
+            available memory.
+
+    Returns:
+        Dict mapping each model name to its model ID, loss, accuracy, macro F1 score, mean and p95 single-image
+        latency (ms) with the default number of threads, and file size (MB).
+    """
+    import os
+    from concurrent.futures import ThreadPoolExecutor
+    import psutil
+    from clearml import Task
+    from keras.models import load_model
+
+    if isinstance(model_names, str):
+        model_names = [name.strip() for name in model_names.split(",") if name.strip()]
+
+    task = Task.init(project_name="CropSpot", task_name="Evaluate Models")
+    logger = task.get_logger()
+    phases = []
+
+    with track_phase("download", logger, phases) as phase:
+        models = {model_name: load_input_model(model_name, project_name, task) for model_name in model_names}
+        phase["items"] = len(models)
+
+    # Decode the test set once into in-memory uint8 batches shared by all models
+    with track_phase("decode", logger, phases) as phase:
+        batches, labels, class_names = load_test_batches(test_dataset)
+        phase["items"] = len(labels)
+
+    # A loaded model takes a few times its file size; leave the rest of the memory to the decoded batches
+    if max_concurrent_models is None:
+        model_memory = 3 * max(os.path.getsize(local_path) for _, local_path in models.values())
+        max_concurrent_models = int(psutil.virtual_memory().available // model_memory)
+    max_concurrent_models = max(1, min(max_concurrent_models, len(models)))
+    print(f"Scoring {len(models)} models, {max_concurrent_models} at a time...")
+
+    def predict(model_name):
+        # Only inference runs concurrently; the metrics are reported from this thread, as pyplot is not thread-safe
+        return predict_batches(load_model(models[model_name][1]), batches)
+
+    with track_phase("evaluation", logger, phases) as phase:
+        with ThreadPoolExecutor(max_workers=max_concurrent_models) as executor:
+            predictions = dict(zip(model_names, executor.map(predict, model_names)))
+
+        metrics_table = {}
+        for model_name in model_names:
+            model_id, local_path = models[model_name]
+            metrics = compute_metrics(labels, predictions.pop(model_name))
+            report_metrics(logger, metrics, class_names, series=model_name)
+
+            print(f"{model_name}: accuracy {metrics['accuracy']:.3f}, F1 {metrics['f1']:.3f}, "
+                  f"loss {metrics['loss']:.3f}")
+            metrics_table[model_name] = {
+                "model_id": model_id,
+                "loss": metrics["loss"],
+                "accuracy": metrics["accuracy"],
+                "f1": metrics["f1"],
+                "size_mb": os.path.getsize(local_path) / 2**20,
+            }
+        phase["items"] = len(labels) * len(models)
+
+    with track_phase("benchmark", logger, phases):
+        for model_name, row in metrics_table.items():
+            results = benchmark_model(models[model_name][1], batch_sizes=(1, 8, 32), thread_counts=(1, None),
+                                      logger=logger, name=model_name)
+            single_image = results[-1]["batches"][1]
+            row["latency_mean_ms"] = single_image["latency_mean_ms"]
+            row["latency_p95_ms"] = single_image["latency_p95_ms"]
+
+    columns = ["model_id", "loss", "accuracy", "f1", "latency_mean_ms", "latency_p95_ms", "size_mb"]
+    logger.report_table(
+        "Model metrics",
+        "test",
+        iteration=0,
+        table_plot=[["model"] + columns] + [
+            [model_name] + [row[column] for column in columns] for model_name, row in metrics_table.items()
+        ],
+    )
+    report_phases(task, phases)
 
-    return score[1]
+    return metrics_table
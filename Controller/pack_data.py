@@ -0,0 +1,181 @@
+from instrumentation import track_phase, report_phases, usable_cpus
+
+
+def load_resized_image(img_path, img_size):
+    """
+    Decode one image and resize it for training.
+
+    Args:
+        img_path (str): Path to the image file.
+        img_size (int): Target width and height.
+
+    Returns:
+        uint8 array of shape (img_size, img_size, 3).
+    """
+    import numpy as np
+    from PIL import Image
+
+    with Image.open(img_path) as img:
+        # Same colour conversion and interpolation as Keras' flow_from_directory
+        img = img.convert("RGB").resize((img_size, img_size), Image.NEAREST)
+        return np.asarray(img, dtype=np.uint8)
+
+
+def write_shards(img_paths, labels, output_dir, prefix, img_size, shard_size, num_workers=None):
+    """
+    Decode and resize images in parallel and write them as uint8 .npy shards.
+
+    Args:
+        img_paths (list): Paths of the images, in the order they are packed.
+        labels (list): Class index of each image.
+        output_dir (str): Directory to write the shards to.
+        prefix (str): File name prefix of the shards (e.g. the subset name).
+        img_size (int): Target width and height.
+        shard_size (int): Maximum number of images per shard.
+        num_workers (int): Number of worker processes. Defaults to the number of usable CPUs.
+
+    Returns:
+        List of shard descriptors with the image file, label file and image count.
+    """
+    import os
+    from concurrent.futures import ProcessPoolExecutor
+    from functools import partial
+    import numpy as np
+
+    if num_workers is None:
+        num_workers = usable_cpus()
+
+    shards = []
+    with ProcessPoolExecutor(max_workers=num_workers) as executor:
+        for shard_index, start in enumerate(range(0, len(img_paths), shard_size)):
+            shard_paths = [str(path) for path in img_paths[start:start + shard_size]]
+            images_file = f"{prefix}_images_{shard_index:05d}.npy"
+            labels_file = f"{prefix}_labels_{shard_index:05d}.npy"
+
+            # Fill the shard in place on disk instead of holding it in memory
+            images = np.lib.format.open_memmap(
+                os.path.join(output_dir, images_file),
+                mode="w+",
+                dtype=np.uint8,
+                shape=(len(shard_paths), img_size, img_size, 3),
+            )
+            chunksize = max(1, len(shard_paths) // (num_workers * 4))
+            for i, img in enumerate(
+                    executor.map(partial(load_resized_image, img_size=img_size), shard_paths, chunksize=chunksize)):
+                images[i] = img
+            images.flush()
+            del images
+
+            np.save(os.path.join(output_dir, labels_file), np.asarray(labels[start:start + shard_size], dtype=np.int16))
+            shards.append({"images": images_file, "labels": labels_file, "count": len(shard_paths)})
+
+    return shards
+
+
+def pack_dataset(dataset_name, project_name, img_size=224, validation_split=0.2, shard_size=2048, dataset_id=None):
+    """
+    Decode and resize the preprocessed images once into sharded uint8 arrays and upload them to ClearML.
+
+    Args:
+        dataset_name (str): Name of the preprocessed dataset.
+        project_name (str): Name of the ClearML project.
+        img_size (int): Width and height the images are resized to.
+        validation_split (float): Fraction of each class held out for validation.
+        shard_size (int): Maximum number of images per shard.
+        dataset_id (str): ID of the preprocessed dataset, to fetch an exact version instead of the latest completed
+            one by name.
+
+    Returns:
+        ID and name of the packed dataset.
+    """
+    from clearml import Dataset, Task
+    import json
+    import os
+    import shutil
+    import numpy as np
+    from pathlib import Path
+
+    task = Task.init(project_name=project_name, task_name="Pack Preprocessed Data")
+    logger = task.get_logger()
+    phases = []
+
+    if dataset_id:
+        prep_dataset = Dataset.get(dataset_id=dataset_id)
+    else:
+        prep_dataset = Dataset.get(dataset_name=dataset_name, only_completed=True)
+    packed_dataset_name = dataset_name + "_packed"
+    packed_tags = [f"source-{prep_dataset.id}", f"size-{img_size}"]
+
+    # Decoding is paid once per dataset version, so reuse an existing pack of this exact version. Drafts left by an
+    # interrupted run are not complete packs.
+    try:
+        existing_dataset = Dataset.get(
+            dataset_name=packed_dataset_name, dataset_project=project_name, dataset_tags=packed_tags,
+            only_completed=True)
+        print(f"Packed dataset '{packed_dataset_name}' already exists for dataset version {prep_dataset.id}.")
+        return existing_dataset.id, existing_dataset.name
+    except ValueError:
+        pass
+
+    print("Downloading the dataset...")
+    with track_phase("download", logger, phases):
+        source_dir = Path(prep_dataset.get_local_copy())
+
+    classes = sorted(category for category in os.listdir(source_dir) if (source_dir / category).is_dir())
+    class_indices = {category: index for index, category in enumerate(classes)}
+
+    # Split each class like flow_from_directory's validation_split: its first files are held out for validation
+    subsets = {"training": ([], []), "validation": ([], [])}
+    for category in classes:
+        files = sorted(file for file in os.listdir(source_dir / category) if file.lower().endswith((".jpg", ".jpeg", ".png")))
+        split = int(validation_split * len(files))
+        for i, file in enumerate(files):
+            img_paths, labels = subsets["validation" if i < split else "training"]
+            img_paths.append(source_dir / category / file)
+            labels.append(class_indices[category])
+
+    packed_dir = Path(f"Dataset/{packed_dataset_name}")
+    if packed_dir.exists():
+        shutil.rmtree(packed_dir)
+    packed_dir.mkdir(parents=True)
+
+    # Store each subset in a fixed shuffled order, so contiguous slices are already well mixed
+    rng = np.random.default_rng(42)
+    index = {"img_size": img_size, "class_indices": class_indices, "subsets": {}}
+    for subset, (img_paths, labels) in subsets.items():
+        order = rng.permutation(len(img_paths))
+        print(f"Packing {len(img_paths)} {subset} images...")
+        with track_phase(f"pack {subset}", logger, phases) as phase:
+            index["subsets"][subset] = write_shards(
+                [img_paths[i] for i in order],
+                [labels[i] for i in order],
+                str(packed_dir),
+                subset,
+                img_size,
+                shard_size,
+            )
+            phase["items"] = len(img_paths)
+
+    with open(packed_dir / "index.json", "w") as file:
+        json.dump(index, file, indent=1)
+
+    # Create a new dataset for the packed images
+    packed_dataset = Dataset.create(
+        dataset_name=packed_dataset_name,
+        dataset_project=project_name,
+        dataset_tags=packed_tags,
+    )
+
+    with track_phase("upload", logger, phases) as phase:
+        # Add the shards to the dataset
+        phase["items"] = packed_dataset.add_files(str(packed_dir), local_base_folder=str(packed_dir))
+
+        # Upload the packed dataset to ClearML
+        packed_dataset.upload()
+
+        # Finalize the dataset
+        packed_dataset.finalize()
+
+    report_phases(task, phases)
+
+    return packed_dataset.id, packed_dataset.name
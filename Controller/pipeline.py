@@ -1,3 +1,43 @@
+def step_helpers(function):
+    """
+    Find the helper functions a pipeline step function needs on its agent.
+
+    A function step only ships the source of its function and helper_functions, not the modules they come from, so
+    every function of this package that the step calls, directly or through other helpers, must be passed along.
+    Module-level imports between the package's modules are only for running the functions locally. The global names
+    used by each function (including in its nested functions, classes and lambdas) are followed recursively.
+
+    Args:
+        function: Step function.
+
+    Returns:
+        List of helper functions, for add_function_step's helper_functions.
+    """
+    import inspect
+    import os
+
+    package_dir = os.path.dirname(os.path.abspath(__file__))
+
+    def global_names(code):
+        yield from code.co_names
+        for const in code.co_consts:
+            if inspect.iscode(const):
+                yield from global_names(const)
+
+    helpers = []
+    pending = [function]
+    while pending:
+        current = pending.pop()
+        for name in global_names(current.__code__):
+            value = current.__globals__.get(name)
+            if (inspect.isfunction(value) and value is not function and value not in helpers
+                    and os.path.dirname(os.path.abspath(inspect.getsourcefile(value))) == package_dir):
+                helpers.append(value)
+                pending.append(value)
+
+    return helpers
+
+
 def create_cropspot_pipeline(
     pipeline_name,
     project_name,
@@ -12,31 +52,59 @@ def create_cropspot_pipeline(
     commit_message,
     repo_url,
     deploy_key_path,
+    colocate_training=False,
+    export_quantization="float16",
+    int8_max_drop=0.01,
+    distill_student=None,
+    selection_metric="accuracy",
+    max_p95_latency_ms=None,
+    num_parallel_trials=1,
+    distributed_tuning_queue=None,
+    warm_start_tuning=False,
+    profile_steps=None,
 ):
     """
     Create a ClearML pipeline for the CropSpot project.
+
+    With colocate_training, all backbones are trained in a single task that shares one data loader, instead of one
+    task per backbone. The best model is also exported to TFLite, quantized as per export_quantization ("none" or
+    "float16"). A separate int8 model is published only if its test accuracy and macro F1 score drop by no more than
+    int8_max_drop. With distill_student (e.g. "MobileNetV2"), the best model is also distilled into a
+    compact student model with that backbone. The best model maximises selection_metric (or minimises it for latency
+    and size) among the models whose p95 single-image latency is below max_p95_latency_ms. The Hyperband searches run
+    num_parallel_trials trials at a time on each training agent, or, with distributed_tuning_queue, as one trial task
+    per configuration on that queue, driven by successive halving, and stop trials that fall below the median of the
+    finished trials. With warm_start_tuning, the searches only try a few configurations around the best
+    hyperparameters of the previous published models. With profile_steps ("first,last"), a TensorFlow profiler trace
+    of those steps of each final fit is uploaded by the training steps.
     """
     from clearml import PipelineController, Task
     from compare_models import compare_models
-    from densenet_train import densenet_train
-    from model_evaluation import evaluate_model
+    from distill_model import distill_model
+    from export_model import export_model
+    from instrumentation import phase_summary_callback
+    from model_evaluation import evaluate_models
+    from pack_data import pack_dataset
     from preprocess_data import preprocess_dataset
-    from resnet_train import resnet_train
+    from quantize_model import quantize_model
+    from train_model import train_model, train_models
     from update_model import update_repository
-    from upload_data import upload_dataset, download_dataset
-    from vgg_train import vgg_train
+    from upload_data import upload_dataset
 
     packages = [
         "pandas",
+        "pillow",
         "numpy",
         "matplotlib",
         "seaborn",
         "tensorflow<2.11",
         "keras",
-        "keras-tuner",
+        # The parallel search relies on the chief serving its oracle from search(), as of keras-tuner 1.3
+        "keras-tuner==1.4.7",
         "tqdm",
         "clearml",
         "scikit-learn",
+        "psutil",
         "GitPython"
     ]
 
@@ -62,10 +130,21 @@ def create_cropspot_pipeline(
     pipeline.add_parameter(name="commit_message", default=commit_message)
     pipeline.add_parameter(name="repo_url", default=repo_url)
     pipeline.add_parameter(name="deploy_key_path", default=deploy_key_path)
+    pipeline.add_parameter(name="export_quantization", default=export_quantization)
+    pipeline.add_parameter(name="int8_max_drop", default=int8_max_drop)
+    pipeline.add_parameter(name="selection_metric", default=selection_metric)
+    pipeline.add_parameter(name="max_p95_latency_ms", default=max_p95_latency_ms)
+    pipeline.add_parameter(name="num_parallel_trials", default=num_parallel_trials)
+    pipeline.add_parameter(name="distributed_tuning_queue", default=distributed_tuning_queue or "")
+    pipeline.add_parameter(name="warm_start_tuning", default=warm_start_tuning)
+    pipeline.add_parameter(name="profile_steps", default=profile_steps or "")
 
     # Set the default execution queue
     pipeline.set_default_execution_queue(queue_name)
 
+    # Gather the phase timings of every finished step into one summary table on the pipeline task
+    report_step_phases = phase_summary_callback()
+
     # Step 1: Upload Data
     pipeline.add_function_step(
         name="Data_Upload",
@@ -77,10 +156,11 @@ def create_cropspot_pipeline(
         ),
         task_type=Task.TaskTypes.data_processing,
         function_return=["raw_dataset_id", "raw_dataset_name"],
-        helper_functions=[download_dataset],
+        helper_functions=step_helpers(upload_dataset),
         parents=None,
         project_name=project_name,
         cache_executed_step=False,
+        post_execute_callback=report_step_phases,
         packages=packages,
     )
 
@@ -91,167 +171,225 @@ def create_cropspot_pipeline(
         function=preprocess_dataset,
         function_kwargs=dict(
             dataset_name="${Data_Upload.raw_dataset_name}",
+            dataset_id="${Data_Upload.raw_dataset_id}",
             project_name="${pipeline.project_name}",
         ),
         task_type=Task.TaskTypes.data_processing,
         function_return=["processed_dataset_id", "processed_dataset_name"],
+        helper_functions=step_helpers(preprocess_dataset),
         parents=["Data_Upload"],
         project_name=project_name,
         cache_executed_step=False,
+        post_execute_callback=report_step_phases,
         packages=packages,
     )
 
-    # Step 3(a): Train Model(s)
+    # Step 3: Pack Data
     pipeline.add_function_step(
-        name="ResNet_Model_Training",
-        task_name="ResNet Train Model",
-        function=resnet_train,
+        name="Data_Packing",
+        task_name="Pack Preprocessed Data",
+        function=pack_dataset,
         function_kwargs=dict(
             dataset_name="${Data_Preprocessing.processed_dataset_name}",
+            dataset_id="${Data_Preprocessing.processed_dataset_id}",
             project_name="${pipeline.project_name}",
         ),
-        task_type=Task.TaskTypes.training,
-        function_return=["resnet_model_id"],
+        task_type=Task.TaskTypes.data_processing,
+        function_return=["packed_dataset_id", "packed_dataset_name"],
+        helper_functions=step_helpers(pack_dataset),
         parents=["Data_Preprocessing"],
         project_name=project_name,
         cache_executed_step=False,
+        post_execute_callback=report_step_phases,
         packages=packages,
     )
 
-    # Step 3(b): Train Model(s)
-    pipeline.add_function_step(
-        name="DenseNet_Model_Training",
-        task_name="DenseNet Train Model",
-        function=densenet_train,
-        function_kwargs=dict(
-            dataset_name="${Data_Preprocessing.processed_dataset_name}",
-            project_name="${pipeline.project_name}",
-        ),
-        task_type=Task.TaskTypes.training,
-        function_return=["densenet_model_id"],
-        parents=["Data_Preprocessing"],
-        project_name=project_name,
-        cache_executed_step=False,
-        packages=packages,
-    )
+    backbones = [("resnet", "ResNet"), ("densenet", "DenseNet"), ("vgg", "VGG")]
 
-    # Step 3(c): Train Model(s)
-    pipeline.add_function_step(
-        name="VGG_Model_Training",
-        task_name="VGG Train Model",
-        function=vgg_train,
-        function_kwargs=dict(
-            dataset_name="${Data_Preprocessing.processed_dataset_name}",
-            project_name="${pipeline.project_name}",
-        ),
-        task_type=Task.TaskTypes.training,
-        function_return=["VGG_model_id"],
-        parents=["Data_Preprocessing"],
-        project_name=project_name,
-        cache_executed_step=False,
-        packages=packages,
-    )
+    # Step 4: Train Model(s), either co-located in one step or one step per backbone
+    if colocate_training:
+        pipeline.add_function_step(
+            name="Model_Training",
+            task_name="Co-located Train Models",
+            function=train_models,
+            function_kwargs=dict(
+                backbones=[backbone for backbone, _ in backbones],
+                dataset_name="${Data_Packing.packed_dataset_name}",
+                dataset_id="${Data_Packing.packed_dataset_id}",
+                project_name="${pipeline.project_name}",
+                num_parallel_trials="${pipeline.num_parallel_trials}",
+                distributed_queue="${pipeline.distributed_tuning_queue}",
+                warm_start="${pipeline.warm_start_tuning}",
+                profile_steps="${pipeline.profile_steps}",
+            ),
+            task_type=Task.TaskTypes.training,
+            function_return=["model_ids"],
+            helper_functions=step_helpers(train_models),
+            parents=["Data_Packing"],
+            project_name=project_name,
+            cache_executed_step=False,
+            post_execute_callback=report_step_phases,
+            packages=packages,
+        )
+        training_steps = {display_name: "Model_Training" for _, display_name in backbones}
+    else:
+        for backbone, display_name in backbones:
+            pipeline.add_function_step(
+                name=f"{display_name}_Model_Training",
+                task_name=f"{display_name} Train Model",
+                function=train_model,
+                function_kwargs=dict(
+                    backbone=backbone,
+                    dataset_name="${Data_Packing.packed_dataset_name}",
+                    dataset_id="${Data_Packing.packed_dataset_id}",
+                    project_name="${pipeline.project_name}",
+                    num_parallel_trials="${pipeline.num_parallel_trials}",
+                    distributed_queue="${pipeline.distributed_tuning_queue}",
+                    warm_start="${pipeline.warm_start_tuning}",
+                    profile_steps="${pipeline.profile_steps}",
+                ),
+                task_type=Task.TaskTypes.training,
+                function_return=["model_id"],
+                helper_functions=step_helpers(train_model),
+                parents=["Data_Packing"],
+                project_name=project_name,
+                cache_executed_step=False,
+                post_execute_callback=report_step_phases,
+                packages=packages,
+            )
+        training_steps = {display_name: f"{display_name}_Model_Training" for _, display_name in backbones}
 
-    # Step 4(a): Evaluate Model(s)
+    # Step 5: Evaluate Model(s) against one decoded copy of the test dataset
     pipeline.add_function_step(
-        name="ResNet_Model_Evaluation",
-        task_name="ResNet Evaluate Model",
-        function=evaluate_model,
+        name="Model_Evaluation",
+        task_name="Evaluate Models",
+        function=evaluate_models,
         function_kwargs=dict(
-            model_name="${pipeline.model_name_1}",
+            model_names="${pipeline.model_name_1},${pipeline.model_name_2},${pipeline.model_name_3}",
             test_dataset="${pipeline.test_dataset}",
             project_name="${pipeline.project_name}",
-            task_name="ResNet Evaluate Model",
         ),
         task_type=Task.TaskTypes.testing,
-        function_return=["test_accuracy"],
-        parents=["ResNet_Model_Training"],
+        function_return=["metrics_table"],
+        helper_functions=step_helpers(evaluate_models),
+        parents=sorted(set(training_steps.values())),
         project_name=project_name,
         cache_executed_step=False,
+        post_execute_callback=report_step_phases,
         packages=packages,
     )
 
-    # Step 4(b): Evaluate Model(s)
+    # Step 6: Compare Model(s)
     pipeline.add_function_step(
-        name="DenseNet_Model_Evaluation",
-        task_name="DenseNet Evaluate Model",
-        function=evaluate_model,
+        name="Model_Comparison",
+        task_name="Compare Models",
+        function=compare_models,
         function_kwargs=dict(
-            model_name="${pipeline.model_name_2}",
-            test_dataset="${pipeline.test_dataset}",
+            metrics_table="${Model_Evaluation.metrics_table}",
             project_name="${pipeline.project_name}",
-            task_name="DenseNet Evaluate Model",
+            metric="${pipeline.selection_metric}",
+            max_p95_latency_ms="${pipeline.max_p95_latency_ms}",
         ),
-        task_type=Task.TaskTypes.testing,
-        function_return=["test_accuracy"],
-        parents=["DenseNet_Model_Training"],
+        task_type=Task.TaskTypes.service,
+        function_return=["best_model_id"],
+        helper_functions=step_helpers(compare_models),
+        parents=["Model_Evaluation"],
         project_name=project_name,
         cache_executed_step=False,
+        post_execute_callback=report_step_phases,
         packages=packages,
     )
 
-    # Step 4(c): Evaluate Model(s)
+    # Step 7: Update Model in GitHub Repository
     pipeline.add_function_step(
-        name="VGG_Model_Evaluation",
-        task_name="VGG Evaluate Model",
-        function=evaluate_model,
+        name="GitHub_Update",
+        task_name="Update Model Weights in GitHub Repository",
+        function=update_repository,
         function_kwargs=dict(
-            model_name="${pipeline.model_name_3}",
-            test_dataset="${pipeline.test_dataset}",
+            model_id="${Model_Comparison.best_model_id}",
             project_name="${pipeline.project_name}",
-            task_name="VGG Evaluate Model",
+            repo_url="${pipeline.repo_url}",
+            repo_path="${pipeline.repo_path}",
+            branch_name="${pipeline.branch}",
+            commit_message="${pipeline.commit_message}",
+            deploy_key_path="${pipeline.deploy_key_path}",
         ),
-        task_type=Task.TaskTypes.testing,
-        function_return=["test_accuracy"],
-        parents=["VGG_Model_Training"],
+        task_type=Task.TaskTypes.service,
+        parents=["Model_Comparison"],
         project_name=project_name,
         cache_executed_step=False,
+        post_execute_callback=report_step_phases,
         packages=packages,
     )
 
-    # Step 5: Compare Model(s)
+    # Step 8: Export the best model to a lean inference format
     pipeline.add_function_step(
-        name="Model_Comparison",
-        task_name="Compare Models",
-        function=compare_models,
+        name="Model_Export",
+        task_name="Export Model",
+        function=export_model,
         function_kwargs=dict(
-            model_name_1="${pipeline.model_name_1}",
-            model_score_1="${ResNet_Model_Evaluation.test_accuracy}",
-            model_name_2="${pipeline.model_name_2}",
-            model_score_2="${DenseNet_Model_Evaluation.test_accuracy}",
-            model_name_3="${pipeline.model_name_3}",
-            model_score_3="${VGG_Model_Evaluation.test_accuracy}",
+            model_id="${Model_Comparison.best_model_id}",
             project_name="${pipeline.project_name}",
+            quantization="${pipeline.export_quantization}",
         ),
-        task_type=Task.TaskTypes.service,
-        function_return=["best_model_id"],
-        parents=["ResNet_Model_Evaluation", "DenseNet_Model_Evaluation", "VGG_Model_Evaluation"],
+        task_type=Task.TaskTypes.custom,
+        function_return=["exported_model_id"],
+        helper_functions=step_helpers(export_model),
+        parents=["Model_Comparison"],
         project_name=project_name,
         cache_executed_step=False,
+        post_execute_callback=report_step_phases,
         packages=packages,
     )
 
-    # Step 6: Update Model in GitHub Repository
+    # Step 9: Quantize the best model to int8, published only if it passes the accuracy gate
     pipeline.add_function_step(
-        name="GitHub_Update",
-        task_name="Update Model Weights in GitHub Repository",
-        function=update_repository,
+        name="Model_Quantization",
+        task_name="Quantize Model",
+        function=quantize_model,
         function_kwargs=dict(
             model_id="${Model_Comparison.best_model_id}",
+            test_dataset="${pipeline.test_dataset}",
+            dataset_name="${Data_Packing.packed_dataset_name}",
+            dataset_id="${Data_Packing.packed_dataset_id}",
             project_name="${pipeline.project_name}",
-            repo_url="${pipeline.repo_url}",
-            repo_path="${pipeline.repo_path}",
-            branch_name="${pipeline.branch}",
-            commit_message="${pipeline.commit_message}",
-            deploy_key_path="${pipeline.deploy_key_path}",
+            max_accuracy_drop="${pipeline.int8_max_drop}",
+            max_f1_drop="${pipeline.int8_max_drop}",
         ),
-        task_type=Task.TaskTypes.service,
+        task_type=Task.TaskTypes.testing,
+        function_return=["int8_model_id"],
+        helper_functions=step_helpers(quantize_model),
         parents=["Model_Comparison"],
         project_name=project_name,
         cache_executed_step=False,
+        post_execute_callback=report_step_phases,
         packages=packages,
     )
 
+    # Step 10 (optional): Distil the best model into a compact student model
+    if distill_student:
+        pipeline.add_function_step(
+            name="Model_Distillation",
+            task_name="Distill Model",
+            function=distill_model,
+            function_kwargs=dict(
+                teacher_model_id="${Model_Comparison.best_model_id}",
+                dataset_name="${Data_Packing.packed_dataset_name}",
+                dataset_id="${Data_Packing.packed_dataset_id}",
+                test_dataset="${pipeline.test_dataset}",
+                project_name="${pipeline.project_name}",
+                student=distill_student,
+            ),
+            task_type=Task.TaskTypes.training,
+            function_return=["student_model_id"],
+            helper_functions=step_helpers(distill_model),
+            parents=["Model_Comparison"],
+            project_name=project_name,
+            cache_executed_step=False,
+            post_execute_callback=report_step_phases,
+            packages=packages,
+        )
+
     # Start the pipeline
     print("CropSpot Data Pipeline initiated. Check ClearML for progress.")
 
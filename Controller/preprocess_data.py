@@ -1,81 +1,269 @@
-def preprocess_dataset(dataset_name, project_name):
+from instrumentation import track_phase, report_phases, usable_cpus
+
+
+def validate_image(img_path, previous_record=None):
+    """
+    Read, hash and decode a single image once and describe it.
+
+    Args:
+        img_path (str): Path to the image file.
+        previous_record (dict): Record of an earlier validation of this file. If the content hash still matches,
+            its verdict is reused and the image is not decoded again.
+
+    Returns:
+        Dict with the path, status ("ok", "corrupt" or "wrong_format"), size, mode, byte count, mtime,
+        content hash and error message.
+    """
+    import hashlib
+    import io
+    import os
+    from PIL import Image
+
+    stat = os.stat(img_path)
+    record = {
+        "path": str(img_path),
+        "status": "ok",
+        "size": None,
+        "mode": None,
+        "bytes": stat.st_size,
+        "mtime": stat.st_mtime,
+        "hash": None,
+        "error": None,
+    }
+
+    if not str(img_path).lower().endswith(".jpg"):
+        record["status"] = "wrong_format"
+        return record
+
+    with open(img_path, "rb") as file:
+        data = file.read()
+    record["hash"] = hashlib.sha256(data).hexdigest()
+
+    # Same content as last time, so the previous verdict still holds
+    if previous_record and previous_record.get("hash") == record["hash"]:
+        for key in ("status", "size", "mode", "error"):
+            record[key] = previous_record.get(key)
+        return record
+
+    try:
+        with Image.open(io.BytesIO(data)) as img:
+            # Force the full decode so truncated/corrupt files fail here
+            img.load()
+            record["size"] = list(img.size)
+            record["mode"] = img.mode
+    except (IOError, SyntaxError, ValueError) as e:
+        record["status"] = "corrupt"
+        record["error"] = str(e)
+
+    return record
+
+
+def validate_images(img_paths, previous_records=None, num_workers=None):
+    """
+    Validate images in parallel over a process pool.
+
+    Args:
+        img_paths (list): Paths of the images to validate.
+        previous_records (list): Optional earlier records, aligned with img_paths (None where there is none).
+        num_workers (int): Number of worker processes. Defaults to the number of usable CPUs.
+
+    Returns:
+        List of validation records (see validate_image), in the same order as img_paths.
+    """
+    from concurrent.futures import ProcessPoolExecutor
+
+    img_paths = [str(path) for path in img_paths]
+    if previous_records is None:
+        previous_records = [None] * len(img_paths)
+
+    if num_workers is None:
+        num_workers = usable_cpus()
+
+    if num_workers <= 1 or len(img_paths) < 2:
+        return [validate_image(path, previous) for path, previous in zip(img_paths, previous_records)]
+
+    # Large chunks keep the inter-process overhead small compared to the decode cost
+    chunksize = max(1, len(img_paths) // (num_workers * 4))
+    with ProcessPoolExecutor(max_workers=num_workers) as executor:
+        return list(executor.map(validate_image, img_paths, previous_records, chunksize=chunksize))
+
+
+def load_manifest(manifest_path):
+    """
+    Load a preprocessing manifest.
+
+    Args:
+        manifest_path (str): Path to the manifest JSON file.
+
+    Returns:
+        Dict mapping each image's relative path to its validation record. Empty if there is no manifest yet.
+    """
+    import json
+    import os
+
+    if not os.path.exists(manifest_path):
+        return {}
+
+    with open(manifest_path) as file:
+        return json.load(file)["files"]
+
+
+def save_manifest(manifest_path, records):
+    """
+    Atomically write a preprocessing manifest.
+
+    Args:
+        manifest_path (str): Path to the manifest JSON file.
+        records (dict): Mapping of relative image path to validation record.
+    """
+    import json
+    import os
+
+    tmp_path = f"{manifest_path}.tmp"
+    with open(tmp_path, "w") as file:
+        json.dump({"version": 1, "files": records}, file, indent=1, sort_keys=True)
+    os.replace(tmp_path, manifest_path)
+
+
+def preprocess_dataset(dataset_name, project_name, dataset_id=None):
     """
     Preprocess images in the raw dataset and upload the preprocessed images to ClearML.
 
+    A manifest of every raw file (size, content hash, verdict and dimensions) is kept in the processed dataset, so
+    reruns only copy and validate files whose content is new or changed since the previous run. The content hashes
+    come from the raw dataset's file entries, so unchanged files are not even read. The local manifest is only
+    updated once the new processed dataset is finalized, so a failed upload is redone by the next run.
+
     Args:
         dataset_name: Name of the raw dataset.
         project_name: Name of the project for the processed dataset.
+        dataset_id: ID of the raw dataset, to fetch an exact version instead of the latest completed one by name.
 
     Returns:
         ID and name of the processed dataset.
     """
     from clearml import Dataset, Task
+    import hashlib
     import os
     import logging
-    import numpy as np
     import shutil
-    from PIL import Image
     from pathlib import Path
 
     task = Task.init(project_name=project_name, task_name="Preprocess Uploaded Data")
+    logger = task.get_logger()
+    phases = []
 
-    # # TEMP CHANGE
-    # prep_dataset = Dataset.get(dataset_name=dataset_name + "_preprocessed")
-    # if prep_dataset:
-    #     print(f"Preprocessed dataset '{dataset_name}_preprocessed' already exists in project '{project_name}'.")
-    #     return prep_dataset.id, prep_dataset.name
-
-    # Access the raw dataset
-    raw_dataset = Dataset.get(dataset_name=dataset_name)
+    # Access the raw dataset. The local copy lives in the ClearML cache, so only new chunks are downloaded.
+    with track_phase("download", logger, phases):
+        if dataset_id:
+            raw_dataset = Dataset.get(dataset_id=dataset_id)
+        else:
+            raw_dataset = Dataset.get(dataset_name=dataset_name, only_completed=True)
+        print("Downloading the dataset...")
+        raw_dir = Path(raw_dataset.get_local_copy())
 
-    # Check if the preprocessed dataset is already downloaded. If not, download it and preprocess the images.
     preprocessed_dir = Path(f"Dataset/{dataset_name}_preprocessed")
-    if preprocessed_dir.exists():
-        print("Dataset already exists")
-
-        # Remove the old preprocessed directory
-        print("Removing the old preprocessed directory...")
-        shutil.rmtree(preprocessed_dir)
-        preprocessed_dir.mkdir()
-
-    print("Downloading the dataset...")
-    raw_dataset.get_mutable_local_copy(str(preprocessed_dir))
-
-    # New preprocessed directory
-    print("Processing images...")
-    for category in os.listdir(preprocessed_dir):
-        category_path = Path(preprocessed_dir) / category
-
-        # Remove non-jpg files
-        count = 0
-        for file in os.listdir(category_path):
-            if not file.lower().endswith(".jpg"):
-                os.remove(os.path.join(category_path, file))
-                count += 1
-        print(f"Removed {count} non-jpg files.")
-
-        # Remove corrupt images
-        removed_files = []
-        for file in os.listdir(category_path):
-            img_path = os.path.join(category_path, file)
-            try:
-                img = Image.open(img_path)
-                np.array(img).flatten()
-            except (IOError, SyntaxError) as e:
-                removed_files.append(file)
-                os.remove(img_path)
-                logging.info(f"Removed corrupt image: {file} due to {e}")
-
-        # Validate image dimensions
-        dimensions = []
-        for file in os.listdir(category_path):
-            img = Image.open(os.path.join(category_path, file))
-            dimensions.append(img.size)
-
-        if len(set(dimensions)) > 1:
-            print("Images have different dimensions.")
+    manifest_path = preprocessed_dir / "manifest.json"
+
+    # Restore the previous processed dataset (and its manifest) if this agent has no local copy of it
+    try:
+        previous_dataset = Dataset.get(
+            dataset_name=dataset_name + "_preprocessed", dataset_project=project_name, only_completed=True)
+    except ValueError:
+        previous_dataset = None
+
+    if previous_dataset and not manifest_path.exists():
+        print("Restoring the previous preprocessed dataset...")
+        previous_dataset.get_mutable_local_copy(str(preprocessed_dir), overwrite=True)
+
+    manifest = load_manifest(manifest_path)
+
+    # Diff the raw files against the manifest by size and content. Every raw dataset version is extracted to a new
+    # cache folder, so mtimes change even for unchanged files.
+    raw_files = {
+        f"{category}/{file}": raw_dir / category / file
+        for category in sorted(os.listdir(raw_dir))
+        if (raw_dir / category).is_dir()
+        for file in sorted(os.listdir(raw_dir / category))
+    }
+    file_entries = raw_dataset.file_entries_dict
+
+    def content_hash(rel_path):
+        entry = file_entries.get(rel_path)
+        if entry is not None and entry.hash:
+            return entry.hash
+        with open(raw_files[rel_path], "rb") as file:
+            return hashlib.sha256(file.read()).hexdigest()
+
+    hashes = {}
+    changed = []
+    for rel_path, raw_path in raw_files.items():
+        record = manifest.get(rel_path)
+        if record and record["bytes"] == raw_path.stat().st_size:
+            hashes[rel_path] = content_hash(rel_path)
+            # Unchanged, and its valid copy (if any) is still in place
+            if record["hash"] == hashes[rel_path] and (
+                    record["status"] != "ok" or (preprocessed_dir / rel_path).exists()):
+                continue
+        changed.append(rel_path)
+    removed = [rel_path for rel_path in manifest if rel_path not in raw_files]
+    print(f"{len(raw_files)} raw files: {len(changed)} new or changed, {len(removed)} removed.")
+
+    if previous_dataset and not changed and not removed:
+        print(f"Preprocessed dataset '{previous_dataset.name}' is up to date.")
+        report_phases(task, phases)
+        return previous_dataset.id, previous_dataset.name
+
+    for rel_path in removed:
+        manifest.pop(rel_path)
+        (preprocessed_dir / rel_path).unlink(missing_ok=True)
+
+    # Validate the new and changed images once, in parallel
+    print(f"Processing {len(changed)} images...")
+    with track_phase("validation", logger, phases) as phase:
+        records = validate_images(
+            [raw_files[rel_path] for rel_path in changed], [manifest.get(rel_path) for rel_path in changed])
+        phase["items"] = len(records)
+
+    # Copy valid images and drop non-jpg and corrupt ones
+    removed_count = {"wrong_format": 0, "corrupt": 0}
+    with track_phase("copy", logger, phases) as phase:
+        for rel_path, record in zip(changed, records):
+            record["path"] = rel_path
+            # Keyed on the same hash as the diff
+            record["hash"] = hashes.get(rel_path) or content_hash(rel_path)
+            manifest[rel_path] = record
+
+            target_path = preprocessed_dir / rel_path
+            if record["status"] == "ok":
+                target_path.parent.mkdir(parents=True, exist_ok=True)
+                shutil.copy2(raw_files[rel_path], target_path)
+                continue
+
+            target_path.unlink(missing_ok=True)
+            removed_count[record["status"]] += 1
+            if record["status"] == "corrupt":
+                logging.info(f"Removed corrupt image: {rel_path} due to {record['error']}")
+        phase["items"] = len(changed) - sum(removed_count.values())
+
+    print(f"Removed {removed_count['wrong_format']} non-jpg files and {removed_count['corrupt']} corrupt images.")
+
+    # Validate image dimensions per category, straight from the manifest
+    dimensions = {}
+    for rel_path, record in manifest.items():
+        if record["status"] == "ok":
+            dimensions.setdefault(rel_path.split("/")[0], set()).add(tuple(record["size"]))
+
+    for category, category_dimensions in sorted(dimensions.items()):
+        if len(category_dimensions) > 1:
+            print(f"{category}: images have different dimensions.")
         else:
-            print("All images have the dimension " + str(dimensions[0]))
+            print(f"{category}: all images have the dimension " + str(next(iter(category_dimensions))))
+
+    # Stage the new manifest outside the processed folder until the dataset is finalized
+    pending_dir = preprocessed_dir.parent / f"{preprocessed_dir.name}_manifest"
+    pending_dir.mkdir(parents=True, exist_ok=True)
+    save_manifest(pending_dir / "manifest.json", manifest)
 
     # Create a new dataset for the preprocessed images
     processed_dataset = Dataset.create(
@@ -84,13 +272,25 @@ def preprocess_dataset(dataset_name, project_name):
         parent_datasets=[raw_dataset],
     )
 
-    # Add the preprocessed images to the dataset
-    processed_dataset.add_files(str(preprocessed_dir), local_base_folder=str(preprocessed_dir))
+    with track_phase("upload", logger, phases) as phase:
+        # Add the preprocessed images and the manifest to the dataset, without the rejected files inherited from the
+        # raw dataset
+        phase["items"] = processed_dataset.add_files(str(preprocessed_dir), local_base_folder=str(preprocessed_dir))
+        # The new manifest replaces the previous one
+        processed_dataset.add_files(str(pending_dir), local_base_folder=str(pending_dir))
+        for rel_path, record in manifest.items():
+            if record["status"] != "ok":
+                processed_dataset.remove_files(rel_path)
+
+        # Upload the training dataset to ClearML
+        processed_dataset.upload()
+
+        # Finalize the dataset
+        processed_dataset.finalize()
 
-    # Upload the training dataset to ClearML
-    processed_dataset.upload()
+    # The new files are only recorded as processed once the dataset holding them is complete
+    os.replace(pending_dir / "manifest.json", manifest_path)
 
-    # Finalize the dataset
-    processed_dataset.finalize()
+    report_phases(task, phases)
 
     return processed_dataset.id, processed_dataset.name
@@ -0,0 +1,96 @@
+from export_model import calibration_images, convert_to_tflite, load_tflite_model
+from model_evaluation import compute_metrics, report_metrics, load_test_batches, predict_batches
+
+
+def quantize_model(model_id, test_dataset, dataset_name, project_name, max_accuracy_drop=0.01, max_f1_drop=0.01,
+                   num_calibration_samples=200, dataset_id=None):
+    """
+    Quantize a trained model to int8 and publish it only if it is about as accurate as the float model.
+
+    Both models are evaluated on the same decoded test set. The int8 model is published as a separate ClearML model
+    when its accuracy and macro F1 score each drop by no more than the given tolerance.
+
+    Args:
+        model_id (str): ClearML ID of the trained Keras model.
+        test_dataset (str): Name of the test dataset.
+        dataset_name (str): Name of the packed dataset, used to calibrate the quantization.
+        project_name (str): Name of the ClearML project.
+        max_accuracy_drop (float): Largest accepted drop in test accuracy.
+        max_f1_drop (float): Largest accepted drop in macro F1 score.
+        num_calibration_samples (int): Number of training images used to calibrate the quantization.
+        dataset_id (str): ID of the packed dataset, to fetch an exact version instead of the latest completed one by
+            name.
+
+    Returns:
+        ID of the published int8 model, or None if it failed the accuracy gate.
+    """
+    import os
+    from clearml import Task, Dataset, InputModel, OutputModel
+    from keras.models import load_model
+
+    task = Task.init(project_name=project_name, task_name="Quantize Model")
+    logger = task.get_logger()
+
+    input_model = InputModel(model_id=model_id)
+    input_model.connect(task=task)
+    model = load_model(input_model.get_local_copy(), compile=False)
+
+    # Convert the model to int8, calibrated on a sample of the training images
+    if dataset_id:
+        dataset = Dataset.get(dataset_id=dataset_id)
+    else:
+        dataset = Dataset.get(dataset_name=dataset_name, only_completed=True)
+    print(f"Quantizing {input_model.name} to int8...")
+    tflite_model = convert_to_tflite(
+        model, "int8", calibration_images(dataset.get_local_copy(), num_calibration_samples))
+
+    exported_model_dir = "Exported Models"
+    if not os.path.exists(exported_model_dir):
+        os.makedirs(exported_model_dir)
+
+    model_file_name = f"{input_model.name}_int8.tflite"
+    with open(os.path.join(exported_model_dir, model_file_name), "wb") as file:
+        file.write(tflite_model)
+
+    # Evaluate the float and int8 models on the same decoded test set
+    batches, labels, class_names = load_test_batches(test_dataset)
+    float_metrics = compute_metrics(labels, predict_batches(model, batches))
+    int8_metrics = compute_metrics(
+        labels, predict_batches(load_tflite_model(os.path.join(exported_model_dir, model_file_name)), batches))
+    report_metrics(logger, float_metrics, class_names, series="float")
+    report_metrics(logger, int8_metrics, class_names, series="int8")
+
+    # Pipeline parameters may arrive as strings
+    max_accuracy_drop, max_f1_drop = float(max_accuracy_drop), float(max_f1_drop)
+
+    accuracy_drop = float_metrics["accuracy"] - int8_metrics["accuracy"]
+    f1_drop = float_metrics["f1"] - int8_metrics["f1"]
+    logger.report_scalar("quantization drop", "accuracy", iteration=0, value=accuracy_drop)
+    logger.report_scalar("quantization drop", "f1", iteration=0, value=f1_drop)
+    print(f"Float: accuracy {float_metrics['accuracy']:.3f}, F1 {float_metrics['f1']:.3f}")
+    print(f"Int8: accuracy {int8_metrics['accuracy']:.3f}, F1 {int8_metrics['f1']:.3f}")
+
+    # Accuracy regression gate
+    if accuracy_drop > max_accuracy_drop or f1_drop > max_f1_drop:
+        print(f"Int8 model not published: accuracy dropped by {accuracy_drop:.4f} (max {max_accuracy_drop}) and F1 "
+              f"by {f1_drop:.4f} (max {max_f1_drop}).")
+        task.add_tags(["int8-rejected"])
+        return None
+
+    output_model = OutputModel(
+        task=task,
+        name=f"{input_model.name}_int8",
+        framework="Tensorflow",
+        tags=["tflite", "int8"],
+    )
+
+    # Upload the quantized model to ClearML
+    output_model.update_weights(
+        os.path.join(exported_model_dir, model_file_name), upload_uri="https://files.clear.ml", auto_delete_file=False)
+
+    # Make sure the model is accessible
+    output_model.publish()
+
+    print(f"Int8 model published with ID: {output_model.id}")
+
+    return output_model.id
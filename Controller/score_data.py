@@ -0,0 +1,133 @@
+from pack_data import load_resized_image
+from serve_model import load_published_model, format_prediction
+
+
+def read_image(uri, img_size):
+    """
+    Fetch one image from a local path or URI and resize it for the model.
+
+    Args:
+        uri (str): Local path, file:// or http(s):// URL, or any URI ClearML's StorageManager can fetch (e.g. s3://).
+        img_size (int): Width and height the image is resized to.
+
+    Returns:
+        uint8 array of shape (img_size, img_size, 3).
+    """
+    import io
+    from urllib.request import urlopen
+
+    if uri.startswith(("http://", "https://")):
+        with urlopen(uri, timeout=60) as response:
+            data = response.read()
+    else:
+        if uri.startswith("file://"):
+            uri = uri[len("file://"):]
+        elif "://" in uri:
+            from clearml import StorageManager
+
+            uri = StorageManager.get_local_copy(uri)
+        with open(uri, "rb") as file:
+            data = file.read()
+
+    return load_resized_image(io.BytesIO(data), img_size)
+
+
+def score_jsonl(input_path, output_path, model_id=None, model_name=None, project_name="CropSpot", batch_size=64,
+                num_threads=None, top_k=3, class_names=None):
+    """
+    Score a JSONL file of images with a published model, streaming predictions to a JSONL output file.
+
+    Each input line is either a JSON string with the image path/URI, or an object with a "path", "uri" or "image"
+    key; objects are copied to the output with the prediction added. Images are fetched and decoded in a thread
+    pool while the previous batch is predicted, and only a bounded window of lines is held in memory, so the input
+    can be arbitrarily large. Output lines keep the input order; failed lines get an "error" key instead.
+
+    Args:
+        input_path (str): Path of the input JSONL file.
+        output_path (str): Path of the output JSONL file.
+        model_id (str): ClearML model ID. Takes precedence over model_name.
+        model_name (str): Model file name (e.g. cropspot_resnet_model.h5).
+        project_name (str): Name of the ClearML project the named model is published in.
+        batch_size (int): Number of images per prediction.
+        num_threads (int): Number of image decoding threads. Defaults to the number of CPUs.
+        top_k (int): Number of most likely classes listed per image.
+        class_names (list): Name of each class, in class index order. Optional.
+
+    Returns:
+        Dict with the number of scored and failed lines.
+    """
+    import json
+    import os
+    from collections import deque
+    from concurrent.futures import Future, ThreadPoolExecutor
+    import numpy as np
+
+    model, img_size = load_published_model(model_id, model_name, project_name)
+
+    num_threads = num_threads or os.cpu_count() or 1
+    max_in_flight = 4 * batch_size
+    counts = {"scored": 0, "failed": 0}
+    report_every = 10000
+
+    with open(input_path) as input_file, open(output_path, "w") as output_file, \
+            ThreadPoolExecutor(max_workers=num_threads) as executor:
+        pending = deque()
+        # (record, image or None, error or None), in input order
+        batch = []
+
+        def flush():
+            images = [image for _, image, error in batch if error is None]
+            predictions = iter(model.predict_on_batch(np.stack(images)) if images else [])
+            for record, _, error in batch:
+                if error is None:
+                    record.update(format_prediction(next(predictions), class_names, top_k))
+                    counts["scored"] += 1
+                else:
+                    record["error"] = error
+                    counts["failed"] += 1
+                output_file.write(json.dumps(record) + "\n")
+
+            processed = counts["scored"] + counts["failed"]
+            if processed // report_every > (processed - len(batch)) // report_every:
+                print(f"Processed {processed} lines...")
+            batch.clear()
+
+        def collect():
+            record, future = pending.popleft()
+            try:
+                batch.append((record, future.result(), None))
+            except Exception as e:
+                batch.append((record, None, f"{type(e).__name__}: {e}"))
+            if len(batch) >= batch_size:
+                flush()
+
+        for line_number, line in enumerate(input_file, start=1):
+            line = line.strip()
+            if not line:
+                continue
+
+            try:
+                record = json.loads(line)
+                if isinstance(record, str):
+                    record = {"path": record}
+                uri = record.get("path") or record.get("uri") or record.get("image")
+                if not uri:
+                    raise ValueError("no path, uri or image key")
+            except (ValueError, AttributeError) as e:
+                # Fail the line in place, so the output still follows the input order
+                future = Future()
+                future.set_exception(e)
+                pending.append(({"line": line_number}, future))
+            else:
+                pending.append((record, executor.submit(read_image, uri, img_size)))
+
+            if len(pending) >= max_in_flight:
+                collect()
+
+        while pending:
+            collect()
+        flush()
+
+    print(f"Scored {counts['scored']} images, {counts['failed']} failed. Predictions written to {output_path}")
+
+    return counts
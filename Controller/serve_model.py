@@ -0,0 +1,194 @@
+from export_model import load_tflite_model
+from pack_data import load_resized_image
+
+
+def load_published_model(model_id=None, model_name=None, project_name="CropSpot"):
+    """
+    Download a published CropSpot model from ClearML and load it for inference.
+
+    Both Keras (.h5) models and exported TFLite (.tflite) models are supported.
+
+    Args:
+        model_id (str): ClearML model ID. Takes precedence over model_name.
+        model_name (str): Model file name (e.g. cropspot_resnet_model.h5 or cropspot_resnet_model_tflite.tflite); the
+            latest published version is used.
+        project_name (str): Name of the ClearML project the named model is published in.
+
+    Returns:
+        Tuple of (Keras model, image size the model expects).
+    """
+    import os
+    from clearml import InputModel
+    from keras.models import load_model
+
+    if model_id:
+        input_model = InputModel(model_id=model_id)
+    elif model_name:
+        input_model = InputModel(name=os.path.splitext(model_name)[0], project=project_name, only_published=True)
+    else:
+        raise ValueError("Either model_id or model_name must be given")
+
+    print(f"Loading model {input_model.name} ({input_model.id})...")
+    local_model = input_model.get_local_copy()
+    if local_model.endswith(".tflite"):
+        model = load_tflite_model(local_model)
+    else:
+        model = load_model(local_model, compile=False)
+
+    return model, model.input_shape[1]
+
+
+def format_prediction(probabilities, class_names=None, top_k=1):
+    """
+    Turn the predicted probabilities of one image into a JSON-serialisable result.
+
+    Args:
+        probabilities: Predicted class probabilities of the image.
+        class_names (list): Name of each class, in class index order. Optional.
+        top_k (int): Number of most likely classes to list.
+
+    Returns:
+        Dict with the predicted class, its confidence and the top-k classes.
+    """
+    import numpy as np
+
+    top = np.argsort(probabilities)[::-1][:top_k]
+    top_k_classes = [
+        {
+            "class_index": int(i),
+            "class_name": class_names[i] if class_names else None,
+            "confidence": float(probabilities[i]),
+        }
+        for i in top
+    ]
+
+    return {**top_k_classes[0], "top_k": top_k_classes}
+
+
+def micro_batcher(predict_batch, max_batch_size=32, max_wait_ms=10):
+    """
+    Create a micro-batcher that groups concurrent single-image requests into batched predictions.
+
+    A background thread waits for the first pending image, then keeps collecting images until the batch is full
+    or max_wait_ms has passed since that first image, and runs one batched prediction for all of them.
+
+    Args:
+        predict_batch: Function from a stacked batch of images to a batch of predictions.
+        max_batch_size (int): Maximum number of images per prediction.
+        max_wait_ms (float): Maximum time the first image of a batch waits for others.
+
+    Returns:
+        Micro-batcher whose submit(image) returns a Future of that image's prediction.
+    """
+    import queue
+    import threading
+    import time
+    from concurrent.futures import Future
+    import numpy as np
+
+    class MicroBatcher:
+        def __init__(self):
+            self.pending = queue.Queue()
+            self.thread = threading.Thread(target=self.run, daemon=True)
+            self.thread.start()
+
+        def submit(self, image):
+            future = Future()
+            self.pending.put((image, future))
+            return future
+
+        def run(self):
+            while True:
+                batch = [self.pending.get()]
+                deadline = time.monotonic() + max_wait_ms / 1000.0
+                while len(batch) < max_batch_size:
+                    timeout = deadline - time.monotonic()
+                    if timeout <= 0:
+                        break
+                    try:
+                        batch.append(self.pending.get(timeout=timeout))
+                    except queue.Empty:
+                        break
+
+                images, futures = zip(*batch)
+                try:
+                    predictions = predict_batch(np.stack(images))
+                except Exception as e:
+                    for future in futures:
+                        future.set_exception(e)
+                    continue
+
+                for future, prediction in zip(futures, predictions):
+                    future.set_result(prediction)
+
+    return MicroBatcher()
+
+
+def serve_model(model_id=None, model_name=None, project_name="CropSpot", host="0.0.0.0", port=8080,
+                max_batch_size=32, max_wait_ms=10, class_names=None, top_k=3):
+    """
+    Serve a published CropSpot model over HTTP, batching concurrent requests.
+
+    POST /predict with the raw image file as the request body returns the prediction as JSON. GET /health returns
+    the loaded model's ID.
+
+    Args:
+        model_id (str): ClearML model ID. Takes precedence over model_name.
+        model_name (str): Model file name (e.g. cropspot_resnet_model.h5).
+        project_name (str): Name of the ClearML project the named model is published in.
+        host (str): Address to listen on.
+        port (int): Port to listen on.
+        max_batch_size (int): Maximum number of images per prediction.
+        max_wait_ms (float): Maximum time an image waits for others to fill its batch.
+        class_names (list): Name of each class, in class index order. Optional.
+        top_k (int): Number of most likely classes returned per image.
+    """
+    import io
+    import json
+    from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+    model, img_size = load_published_model(model_id, model_name, project_name)
+    batcher = micro_batcher(model.predict_on_batch, max_batch_size, max_wait_ms)
+
+    class PredictionHandler(BaseHTTPRequestHandler):
+        def send_json(self, status, body):
+            data = json.dumps(body).encode()
+            self.send_response(status)
+            self.send_header("Content-Type", "application/json")
+            self.send_header("Content-Length", str(len(data)))
+            self.end_headers()
+            self.wfile.write(data)
+
+        def do_GET(self):
+            if self.path != "/health":
+                self.send_json(404, {"error": "Not found"})
+                return
+            self.send_json(200, {"status": "ok", "model": model_id or model_name})
+
+        def do_POST(self):
+            if self.path != "/predict":
+                self.send_json(404, {"error": "Not found"})
+                return
+
+            try:
+                image = load_resized_image(io.BytesIO(self.rfile.read(int(self.headers["Content-Length"]))), img_size)
+            except (IOError, SyntaxError, ValueError, TypeError) as e:
+                self.send_json(400, {"error": f"Invalid image: {e}"})
+                return
+
+            try:
+                probabilities = batcher.submit(image).result()
+            except Exception as e:
+                # A failed batch fails every request in it; answer each instead of dropping the connection
+                self.send_json(500, {"error": f"Prediction failed: {e}"})
+                return
+            self.send_json(200, format_prediction(probabilities, class_names, top_k))
+
+    server = ThreadingHTTPServer((host, port), PredictionHandler)
+    print(f"Serving on http://{host}:{port} (max batch size {max_batch_size}, max wait {max_wait_ms} ms)")
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        server.server_close()
@@ -0,0 +1,775 @@
+from data_loader import load_packed_dataset, packed_dataset, packed_sequence, rescaled_input
+from distributed_tuning import (
+    sample_configurations,
+    successive_halving,
+    local_trial_runner,
+    clearml_trial_runner,
+    fixed_hyperparameters,
+)
+from feature_cache import (
+    backbone_extractor,
+    cached_features_multi,
+    publish_features,
+    load_published_features,
+    feature_dataset,
+    assemble_model,
+)
+from instrumentation import track_phase, report_phases, usable_cpus
+from training_profiler import training_profiler, profile_step_range
+from trial_pruning import trial_pruner, report_pruning
+from tuner_state import tuner_state_key, restore_tuner_state, save_tuner_state, tuner_state_saver
+from warm_start import previous_best_hyperparameters, warm_start_configurations
+
+
+def get_backbone(backbone):
+    """
+    Look up a backbone in the registry.
+
+    ResNet50V2, DenseNet121 and VGG19 are registered as "resnet", "densenet" and "vgg". Any other keras.applications
+    model can be plugged in by its class name (e.g. "EfficientNetB0").
+
+    Args:
+        backbone (str): Registry key or keras.applications class name.
+
+    Returns:
+        Dict with the backbone key, Keras application, display name, ClearML task name and model name.
+    """
+    import keras.applications
+
+    registry = {
+        "resnet": ("ResNet50V2", "ResNet"),
+        "densenet": ("DenseNet121", "DenseNet"),
+        "vgg": ("VGG19", "VGG"),
+    }
+
+    if backbone in registry:
+        key = backbone
+        application_name, display_name = registry[backbone]
+    elif hasattr(keras.applications, backbone):
+        key = backbone.lower()
+        application_name = display_name = backbone
+    else:
+        raise ValueError(f"Unknown backbone: {backbone}")
+
+    return {
+        "key": key,
+        "application": getattr(keras.applications, application_name),
+        "display_name": display_name,
+        "task_name": f"{display_name} Train Model",
+        "model_name": f"cropspot_{key}_model",
+    }
+
+
+def build_hypermodel(application, input_shape, num_classes, feature_shape=None):
+    """
+    Create the CropSpot hypermodel: a frozen ImageNet backbone with a tunable classification head.
+
+    Args:
+        application: Keras application constructor of the backbone.
+        input_shape (tuple): Shape of one image.
+        num_classes (int): Number of classes.
+        feature_shape (tuple): Shape of the cached backbone features. If set, only the head is built.
+
+    Returns:
+        keras_tuner HyperModel.
+    """
+    from keras.models import Model
+    from keras.layers import Input, GlobalAveragePooling2D, Dense, BatchNormalization, Activation, Dropout
+    from keras.optimizers import Adam, RMSprop, SGD
+    from keras_tuner import HyperModel
+
+    class CropSpotHyperModel(HyperModel):
+        def __init__(self, input_shape, num_classes, feature_shape=None):
+            self.input_shape = input_shape
+            self.num_classes = num_classes
+            self.feature_shape = feature_shape
+
+        def build(self, hp):
+            if self.feature_shape:
+                # Head only, trained on cached backbone features
+                inputs = Input(shape=self.feature_shape)
+                x = inputs
+            else:
+                # Pixels arrive as raw uint8 values and are rescaled inside the model
+                inputs, rescaled = rescaled_input(self.input_shape)
+                base_model = application(weights="imagenet", include_top=False, input_tensor=rescaled)
+
+                # Freeze the base model
+                for layer in base_model.layers:
+                    layer.trainable = False
+
+                x = base_model.output
+                x = GlobalAveragePooling2D()(x)
+
+            # Hyperparameters for the fully connected layers
+            x = Dense(units=hp.Int("units_1", min_value=128, max_value=1024, step=128))(x)
+            x = BatchNormalization()(x)
+            x = Activation("relu")(x)
+            x = Dropout(rate=hp.Float("dropout_1", min_value=0.0, max_value=0.5, step=0.1))(x)
+
+            x = Dense(units=hp.Int("units_2", min_value=128, max_value=1024, step=128))(x)
+            x = BatchNormalization()(x)
+            x = Activation("relu")(x)
+            x = Dropout(rate=hp.Float("dropout_2", min_value=0.0, max_value=0.5, step=0.1))(x)
+
+            x = Dense(units=hp.Int("units_3", min_value=128, max_value=1024, step=128))(x)
+            x = BatchNormalization()(x)
+            x = Activation("relu")(x)
+            x = Dropout(rate=hp.Float("dropout_3", min_value=0.0, max_value=0.5, step=0.1))(x)
+
+            predictions = Dense(self.num_classes, activation="softmax")(x)
+
+            model = Model(inputs=inputs, outputs=predictions)
+
+            # Hyperparameter: Optimizer selection
+            optimizer_name = hp.Choice("optimizer", ["adam", "rmsprop", "sgd"])
+            learning_rate = hp.Float("learning_rate", min_value=1e-5, max_value=1e-2, sampling="LOG")
+
+            if optimizer_name == "adam":
+                optimizer = Adam(learning_rate=learning_rate)
+            elif optimizer_name == "rmsprop":
+                optimizer = RMSprop(learning_rate=learning_rate)
+            elif optimizer_name == "sgd":
+                optimizer = SGD(learning_rate=learning_rate)
+            else:
+                raise Exception(f"Illegal optimizer name given: {optimizer_name}")
+
+            model.compile(optimizer=optimizer, loss="categorical_crossentropy", metrics=["accuracy"])
+
+            return model
+
+    return CropSpotHyperModel(input_shape=input_shape, num_classes=num_classes, feature_shape=feature_shape)
+
+
+def load_training_data(dataset_name, batch_size=64, dataset_id=None):
+    """
+    Fetch the packed dataset and build its training and validation input pipelines.
+
+    Args:
+        dataset_name (str): Name of the packed dataset.
+        batch_size (int): Number of images per batch.
+        dataset_id (str): ID of the packed dataset, to fetch an exact version instead of the latest completed one by
+            name.
+
+    Returns:
+        Dict with the dataset ID and local path, the training and validation pipelines, image shape, number of
+        classes and batch size.
+    """
+    from clearml import Dataset
+
+    # The local copy is cached by ClearML, so each dataset version is only downloaded once
+    if dataset_id:
+        dataset = Dataset.get(dataset_id=dataset_id)
+    else:
+        dataset = Dataset.get(dataset_name=dataset_name, only_completed=True)
+    dataset_path = dataset.get_local_copy()
+
+    # Batches are served straight from the pre-resized uint8 shards and prefetched while the model computes
+    train_generator, train_sequence = packed_dataset(dataset_path, "training", batch_size, shuffle=True, seed=42)
+    test_generator, _ = packed_dataset(dataset_path, "validation", batch_size, shuffle=False)
+
+    return {
+        "dataset_id": dataset.id,
+        "path": dataset_path,
+        "train": train_generator,
+        "validation": test_generator,
+        "image_shape": train_sequence.image_shape,
+        "num_classes": train_sequence.num_classes,
+        "batch_size": batch_size,
+    }
+
+
+def backbone_features(specs, data):
+    """
+    Get the cached backbone features of the training and validation images, computing them if needed.
+
+    The features of all given backbones are computed in a single sweep, so every batch is read once.
+
+    Args:
+        specs (list): Backbones returned by get_backbone.
+        data (dict): Training data returned by load_training_data.
+
+    Returns:
+        List of (feature extractor, dict of subset to (features, one-hot labels)) tuples, one per backbone.
+    """
+    extractors = [backbone_extractor(spec["application"], data["image_shape"]) for spec in specs]
+
+    features = [{} for _ in specs]
+    for subset in ("training", "validation"):
+        subset_features = cached_features_multi(
+            extractors,
+            packed_sequence(data["path"], subset, data["batch_size"], shuffle=False),
+            [feature_paths(data, extractor)[subset] for extractor in extractors],
+        )
+        for backbone_index, result in enumerate(subset_features):
+            features[backbone_index][subset] = result
+
+    return list(zip(extractors, features))
+
+
+def feature_paths(data, extractor):
+    """
+    Get the cache files of a backbone's features of the training and validation images.
+
+    Args:
+        data (dict): Training data returned by load_training_data.
+        extractor: Feature extractor returned by backbone_extractor.
+
+    Returns:
+        Dict of subset to .npy feature file path.
+    """
+    import os
+
+    cache_dir = f"Dataset/features/{data['dataset_id']}"
+    return {subset: os.path.join(cache_dir, f"{extractor.name}_{subset}.npy") for subset in ("training", "validation")}
+
+
+def build_tuner(spec, data, feature_shape=None, project_name=None):
+    """
+    Create the Hyperband tuner of a backbone, stored in the backbone's tuner directory.
+
+    Existing state of the same project is reloaded, so an interrupted search resumes where it stopped.
+
+    Args:
+        spec (dict): Backbone returned by get_backbone.
+        data (dict): Training data returned by load_training_data (at least image_shape and num_classes).
+        feature_shape (tuple): Shape of the cached backbone features, to tune only the head.
+        project_name (str): keras_tuner project name, e.g. from tuner_state_key.
+
+    Returns:
+        keras_tuner Hyperband tuner.
+    """
+    from keras_tuner.tuners import Hyperband
+
+    hypermodel = build_hypermodel(spec["application"], data["image_shape"], data["num_classes"], feature_shape)
+
+    return Hyperband(
+        hypermodel,
+        objective="val_accuracy",
+        max_epochs=10,
+        factor=3,
+        hyperband_iterations=1,
+        directory=f"{spec['key']}_keras_tuner",
+        project_name=project_name or (f"{spec['key']}_tuning_features" if feature_shape else f"{spec['key']}_tuning"),
+        overwrite=False,
+    )
+
+
+def tuning_worker(tuner_id, oracle_port, num_threads, spec, packed_path, batch_size, feature_files=None,
+                  project_name=None, history_path=None):
+    """
+    Run Hyperband trials of a parallel search in a worker process, until the chief oracle stops the search.
+
+    Args:
+        tuner_id (str): keras_tuner ID of this worker.
+        oracle_port (int): Local port of the chief oracle.
+        num_threads (int): Number of TensorFlow threads of the worker.
+        spec (dict): Backbone returned by get_backbone.
+        packed_path (str): Local path of the packed dataset.
+        batch_size (int): Number of samples per batch.
+        feature_files (dict): Subset to cached feature file, to tune only the head.
+        project_name (str): keras_tuner project name of the search.
+        history_path (str): Trial history file to prune the worker's trials against (see trial_pruner).
+    """
+    import os
+
+    # keras_tuner reads its role from the environment
+    os.environ["KERASTUNER_TUNER_ID"] = tuner_id
+    os.environ["KERASTUNER_ORACLE_IP"] = "127.0.0.1"
+    os.environ["KERASTUNER_ORACLE_PORT"] = str(oracle_port)
+
+    import numpy as np
+    import tensorflow as tf
+
+    tf.config.threading.set_intra_op_parallelism_threads(num_threads)
+    tf.config.threading.set_inter_op_parallelism_threads(1)
+
+    sequence = packed_sequence(packed_path, "training", batch_size)
+    data = {"image_shape": sequence.image_shape, "num_classes": sequence.num_classes}
+
+    if feature_files:
+        inputs = {}
+        for subset, feature_file in feature_files.items():
+            # Features are cached in the unshuffled order of the packed labels
+            _, label_shards, _ = load_packed_dataset(packed_path, subset)
+            labels = np.eye(data["num_classes"], dtype=np.float32)[np.concatenate(label_shards)]
+            inputs[subset] = feature_dataset(np.load(feature_file), labels, batch_size, shuffle=subset == "training")
+        feature_shape = np.load(feature_files["training"], mmap_mode="r").shape[1:]
+    else:
+        inputs = {
+            subset: packed_dataset(packed_path, subset, batch_size, shuffle=subset == "training")[0]
+            for subset in ("training", "validation")
+        }
+        feature_shape = None
+
+    tuner = build_tuner(spec, data, feature_shape, project_name)
+    tuner.search(
+        inputs["training"],
+        epochs=10,
+        validation_data=inputs["validation"],
+        callbacks=[trial_pruner(history_path)] if history_path else [],
+    )
+
+
+def parallel_search(spec, data, num_workers, feature_files=None, feature_shape=None, project_name=None,
+                    history_path=None):
+    """
+    Run a Hyperband search with several trials at a time, each in its own worker process.
+
+    This process serves the Hyperband oracle as the keras_tuner chief, over a local port, while the workers run the
+    trials with an equal share of the CPUs. The oracle state and trials are kept in the backbone's tuner directory.
+
+    Args:
+        spec (dict): Backbone returned by get_backbone.
+        data (dict): Training data returned by load_training_data.
+        num_workers (int): Number of trials run at the same time.
+        feature_files (dict): Subset to cached feature file, to tune only the head.
+        feature_shape (tuple): Shape of the cached backbone features.
+        project_name (str): keras_tuner project name of the search.
+        history_path (str): Trial history file the workers prune their trials against (see trial_pruner).
+
+    Returns:
+        The chief's tuner, holding the results of all trials.
+    """
+    import os
+    import socket
+    from multiprocessing import get_context
+
+    cpus = usable_cpus()
+    num_threads = max(1, cpus // num_workers)
+
+    with socket.socket() as sock:
+        sock.bind(("127.0.0.1", 0))
+        oracle_port = sock.getsockname()[1]
+
+    print(f"Running {num_workers} trials at a time with {num_threads} threads each...")
+    context = get_context("spawn")
+    workers = [
+        context.Process(
+            target=tuning_worker,
+            args=(
+                f"tuner{i}",
+                oracle_port,
+                num_threads,
+                spec,
+                data["path"],
+                data["batch_size"],
+                feature_files,
+                project_name,
+                history_path,
+            ),
+        )
+        for i in range(num_workers)
+    ]
+    for worker in workers:
+        worker.start()
+
+    environment = {
+        "KERASTUNER_TUNER_ID": "chief",
+        "KERASTUNER_ORACLE_IP": "127.0.0.1",
+        "KERASTUNER_ORACLE_PORT": str(oracle_port),
+    }
+    os.environ.update(environment)
+    try:
+        # The chief's search serves the oracle, and returns once the workers have finished the search
+        tuner = build_tuner(spec, data, feature_shape, project_name)
+        tuner.search()
+    finally:
+        for key in environment:
+            os.environ.pop(key, None)
+        for worker in workers:
+            worker.join()
+
+    return tuner
+
+
+def fit_trial(hypermodel, values, epochs, train_generator, test_generator, logger=None, pruner=None):
+    """
+    Train one hyperparameter configuration of a search from scratch.
+
+    Args:
+        hypermodel: keras_tuner HyperModel.
+        values (dict): Hyperparameter values.
+        epochs (int): Number of epochs.
+        train_generator: Training data.
+        test_generator: Validation data.
+        logger: ClearML logger to report the validation accuracy to.
+        pruner: Callback from trial_pruner to stop the trial early if it falls behind the others.
+
+    Returns:
+        Best validation accuracy of the trial.
+    """
+    from keras.callbacks import LambdaCallback
+
+    callbacks = [pruner] if pruner is not None else []
+    if logger is not None:
+        callbacks.append(LambdaCallback(
+            on_epoch_end=lambda epoch, logs: logger.report_scalar(
+                "val_accuracy", "validation", iteration=epoch, value=logs["val_accuracy"])
+        ))
+
+    model = hypermodel.build(fixed_hyperparameters(values))
+    history = model.fit(
+        train_generator, epochs=int(epochs), validation_data=test_generator, callbacks=callbacks, verbose=2)
+    return max(history.history["val_accuracy"])
+
+
+def run_trial(values, epochs, backbone, dataset_id, project_name, use_feature_cache=True, features_dataset_id=None):
+    """
+    Train one hyperparameter configuration as a trial task of a distributed search (see clearml_trial_runner).
+
+    Args:
+        values (str): JSON hyperparameter values.
+        epochs (int): Number of epochs.
+        backbone (str): keras.applications class name of the backbone.
+        dataset_id (str): ID of the packed dataset.
+        project_name (str): Name of the ClearML project.
+        use_feature_cache (bool): Train only the head, on cached backbone features.
+        features_dataset_id (str): ID of the backbone features published by the search's controller (see
+            publish_features), so the trial does not run the backbone itself.
+    """
+    import json
+    from clearml import Task
+
+    task = Task.init(project_name=project_name, task_name=f"{backbone} Tuning Trial")
+
+    # Task arguments may arrive as strings
+    use_feature_cache = str(use_feature_cache) == "True"
+
+    spec = get_backbone(backbone)
+
+    if use_feature_cache and features_dataset_id not in (None, "", "None"):
+        # Only the head is trained, so the packed images are not needed
+        features = load_published_features(features_dataset_id)
+        data = {"image_shape": None, "num_classes": features["training"][1].shape[1], "batch_size": 64}
+    else:
+        data = load_training_data(None, dataset_id=dataset_id)
+        features = backbone_features([spec], data)[0][1] if use_feature_cache else None
+
+    if use_feature_cache:
+        train_generator = feature_dataset(*features["training"], data["batch_size"], shuffle=True)
+        test_generator = feature_dataset(*features["validation"], data["batch_size"], shuffle=False)
+        feature_shape = features["training"][0].shape[1:]
+    else:
+        train_generator, test_generator = data["train"], data["validation"]
+        feature_shape = None
+
+    hypermodel = build_hypermodel(spec["application"], data["image_shape"], data["num_classes"], feature_shape)
+    fit_trial(hypermodel, json.loads(values), epochs, train_generator, test_generator, task.get_logger())
+
+
+def fit_backbone(spec, data, logger, extractor=None, features=None, report_prefix="", phases=None,
+                 profile_steps=None, num_parallel_trials=1, distributed_queue=None, warm_start=False):
+    """
+    Tune the hyperparameters of one backbone's model with Hyperband and train the best configuration.
+
+    Search trials falling below the median val_accuracy of the finished trials are stopped early (see trial_pruner).
+
+    Args:
+        spec (dict): Backbone returned by get_backbone.
+        data (dict): Training data returned by load_training_data.
+        logger: ClearML logger to report the training curves to.
+        extractor: Feature extractor returned by backbone_features. If set, only the head is tuned and trained.
+        features (dict): Cached features returned by backbone_features, along with the extractor.
+        report_prefix (str): Prefix of the reported scalar titles, to tell backbones apart on a shared task.
+        phases (list): List to append the tuner search and final fit phase records to (see track_phase).
+        profile_steps (tuple): Optional (first, last) step of the final fit to capture a TensorFlow profiler trace of.
+        num_parallel_trials (int): Number of Hyperband trials run at the same time, in separate processes.
+        distributed_queue (str): ClearML queue to run the search on instead, one trial task per configuration,
+            driven by successive halving. "local" runs the trials in this process instead of on a queue.
+        warm_start (bool): Start from the best hyperparameters of the backbone's previous published model, and only
+            run successive halving over a few configurations around them (on distributed_queue, or in this process).
+            Falls back to the full search if there is no previous model.
+
+    Returns:
+        Tuple of (trained image-to-prediction model, best hyperparameters).
+    """
+    import os
+    from clearml import Task
+    from keras.callbacks import EarlyStopping, LambdaCallback
+
+    if extractor is not None:
+        train_generator = feature_dataset(*features["training"], data["batch_size"], shuffle=True)
+        test_generator = feature_dataset(*features["validation"], data["batch_size"], shuffle=False)
+        feature_shape = features["training"][0].shape[1:]
+    else:
+        train_generator, test_generator = data["train"], data["validation"]
+        feature_shape = None
+
+    # Task arguments may arrive as strings
+    num_parallel_trials = int(num_parallel_trials)
+    warm_start = str(warm_start) == "True"
+
+    # Search for the best hyperparameters
+    with track_phase(f"{report_prefix}tuner search", logger, phases):
+        project_name = Task.current_task().get_project_name()
+        warm_values = previous_best_hyperparameters(spec, project_name) if warm_start else None
+        if distributed_queue or warm_values:
+            hypermodel = build_hypermodel(spec["application"], data["image_shape"], data["num_classes"], feature_shape)
+            # Trials on other agents cannot share a history file, so only trials run here are pruned
+            history_path = os.path.join(f"{spec['key']}_keras_tuner", "successive_halving", "pruning_history.json")
+            if os.path.exists(history_path):
+                os.remove(history_path)
+
+            if distributed_queue in (None, "", "local"):
+                pruner = trial_pruner(history_path, logger, report_prefix)
+                run_trials = local_trial_runner(
+                    lambda values, epochs: fit_trial(
+                        hypermodel, values, epochs, train_generator, test_generator, pruner=pruner))
+            else:
+                run_trials = clearml_trial_runner(
+                    distributed_queue,
+                    run_trial,
+                    backbone=spec["application"].__name__,
+                    dataset_id=data["dataset_id"],
+                    project_name=project_name,
+                    use_feature_cache=extractor is not None,
+                    # Trials download the features computed here instead of running the backbone again
+                    features_dataset_id=(
+                        publish_features(features, extractor.name, data["dataset_id"], project_name)
+                        if extractor is not None else ""
+                    ),
+                )
+            if warm_values:
+                configs = warm_start_configurations(hypermodel, warm_values, num_configs=9)
+            else:
+                configs = sample_configurations(hypermodel, num_configs=27)
+            best_values, _ = successive_halving(configs, run_trials, max_epochs=10, factor=3, logger=logger)
+            best_hps = fixed_hyperparameters(best_values)
+        else:
+            # Resume the search from the saved state of the same backbone, dataset version and search space
+            state_key = tuner_state_key(
+                spec,
+                data["dataset_id"],
+                build_hypermodel(spec["application"], data["image_shape"], data["num_classes"], feature_shape),
+            )
+            project_dir = os.path.join(f"{spec['key']}_keras_tuner", state_key)
+            restore_tuner_state(state_key, project_dir, project_name)
+            # Kept with the tuner state, so a resumed search prunes against its earlier trials
+            history_path = os.path.join(project_dir, "pruning_history.json")
+
+            if num_parallel_trials > 1:
+                feature_files = feature_paths(data, extractor) if extractor is not None else None
+                tuner = parallel_search(
+                    spec, data, num_parallel_trials, feature_files, feature_shape, state_key, history_path)
+            else:
+                tuner = build_tuner(spec, data, feature_shape, state_key)
+                tuner.search_space_summary()
+
+                search_profiler = training_profiler(logger, f"{report_prefix}search ")
+                tuner.search(
+                    search_profiler.wrap(train_generator),
+                    epochs=10,
+                    validation_data=test_generator,
+                    callbacks=[
+                        search_profiler,
+                        trial_pruner(history_path, logger, report_prefix),
+                        tuner_state_saver(state_key, project_dir),
+                    ],
+                )
+            save_tuner_state(state_key, project_dir)
+            hypermodel = tuner.hypermodel
+
+            # Get the optimal hyperparameters
+            best_hps = tuner.get_best_hyperparameters(num_trials=1)[0]
+        report_pruning(logger, history_path, report_prefix)
+    print(f"Best hyperparameters: {best_hps.values}")
+
+    # Build the model with the best hyperparameters and train it on the data for up to 60 epochs
+    model = hypermodel.build(best_hps)
+
+    epochs = 60
+    profiler = training_profiler(logger, report_prefix, profile_steps)
+    with track_phase(f"{report_prefix}final fit", logger, phases):
+        model.fit(
+            profiler.wrap(train_generator),
+            epochs=epochs,
+            validation_data=test_generator,
+            callbacks=[
+                EarlyStopping(monitor="val_accuracy", patience=10, min_delta=0.001, restore_best_weights=True),
+                LambdaCallback(
+                    on_epoch_end=lambda epoch, logs: [
+                        logger.report_scalar(f"{report_prefix}loss", "train", iteration=epoch, value=logs["loss"]),
+                        logger.report_scalar(
+                            f"{report_prefix}accuracy", "train", iteration=epoch, value=logs["accuracy"]),
+                        logger.report_scalar(
+                            f"{report_prefix}val_loss", "validation", iteration=epoch, value=logs["val_loss"]),
+                        logger.report_scalar(
+                            f"{report_prefix}val_accuracy", "validation", iteration=epoch, value=logs["val_accuracy"]),
+                    ]
+                ),
+                profiler,
+            ],
+        )
+
+    # Put the trained head back on its backbone, so the exported model still takes images
+    if extractor is not None:
+        model = assemble_model(extractor, model)
+
+    return model, best_hps
+
+
+def publish_model(task, model, spec, hyperparameters=None):
+    """
+    Save a trained model and publish it to ClearML.
+
+    Args:
+        task: ClearML task the model belongs to.
+        model: Trained Keras model.
+        spec (dict): Backbone returned by get_backbone.
+        hyperparameters (dict): Hyperparameter values the model was built with, stored for warm-started searches
+            (see previous_best_hyperparameters).
+
+    Returns:
+        ID of the published model.
+    """
+    import os
+    from clearml import OutputModel
+
+    trained_model_dir = "Trained Models"
+
+    # Save and upload the model to ClearML
+    if not os.path.exists(trained_model_dir):
+        os.makedirs(trained_model_dir)
+
+    model_file_name = f"{spec['model_name']}.h5"
+    model.save(os.path.join(trained_model_dir, model_file_name))
+
+    output_model = OutputModel(task=task, name=spec["model_name"], framework="Tensorflow")
+
+    # The model rescales its input itself (see rescaled_input), so consumers must feed raw pixels
+    output_model.set_metadata("input_range", "0-255")
+
+    # Upload the model weights to ClearML
+    output_model.update_weights(
+        os.path.join(trained_model_dir, model_file_name), upload_uri="https://files.clear.ml", auto_delete_file=False)
+
+    task.upload_artifact(f"{spec['display_name']} Model", artifact_object=model_file_name)
+    if hyperparameters is not None:
+        task.upload_artifact(f"{spec['model_name']}_hyperparameters", artifact_object=hyperparameters)
+
+    # Make sure the model is accessible
+    output_model.publish()
+
+    return output_model.id
+
+
+def train_model(backbone, dataset_name, project_name, use_feature_cache=True, profile_steps=None,
+                num_parallel_trials=1, distributed_queue=None, warm_start=False, dataset_id=None):
+    """
+    Train the CropSpot model on one backbone using the packed dataset.
+
+    Args:
+        backbone (str): Backbone registry key or keras.applications class name (see get_backbone).
+        dataset_name (str): Name of the packed dataset
+        project_name (str): Name of the ClearML project
+        use_feature_cache (bool): Tune and train only the head, on backbone features computed once per dataset version
+        profile_steps: Optional (first, last) step, or "first,last", of the final fit to capture a TensorFlow
+            profiler trace of
+        num_parallel_trials (int): Number of Hyperband trials run at the same time, in separate processes
+        distributed_queue (str): ClearML queue to run the search's trials on as tasks ("local" for this process)
+        warm_start (bool): Search only around the best hyperparameters of the previous published model
+        dataset_id (str): ID of the packed dataset, to fetch an exact version instead of the latest by name
+
+    Returns:
+        ID of the trained model
+    """
+    from clearml import Task
+
+    spec = get_backbone(backbone)
+    # Task arguments may arrive as strings
+    profile_steps = profile_step_range(profile_steps)
+
+    task = Task.init(project_name=project_name, task_name=spec["task_name"])
+    logger = task.get_logger()
+    phases = []
+
+    with track_phase("download", logger, phases):
+        data = load_training_data(dataset_name, dataset_id=dataset_id)
+
+    with track_phase("features", logger, phases):
+        extractor, features = backbone_features([spec], data)[0] if use_feature_cache else (None, None)
+    model, best_hps = fit_backbone(
+        spec,
+        data,
+        logger,
+        extractor,
+        features,
+        phases=phases,
+        profile_steps=profile_steps,
+        num_parallel_trials=num_parallel_trials,
+        distributed_queue=distributed_queue,
+        warm_start=warm_start,
+    )
+
+    with track_phase("save", logger, phases):
+        model_id = publish_model(task, model, spec, best_hps.values)
+
+    report_phases(task, phases)
+    return model_id
+
+
+def train_models(backbones, dataset_name, project_name, use_feature_cache=True, profile_steps=None,
+                 num_parallel_trials=1, distributed_queue=None, warm_start=False, dataset_id=None):
+    """
+    Train the CropSpot model on several backbones in one co-located task, sharing one data loader.
+
+    The packed dataset is fetched once. With the feature cache, every batch is read once and fed to all backbones
+    to compute their features, and each head is then tuned on its own cached features. Without it, the backbones are
+    trained one after the other on the same memory-mapped shards, so the data is read from the page cache.
+
+    Args:
+        backbones (list): Backbone registry keys or keras.applications class names (see get_backbone).
+        dataset_name (str): Name of the packed dataset
+        project_name (str): Name of the ClearML project
+        use_feature_cache (bool): Tune and train only the heads, on backbone features computed once per dataset version
+        profile_steps: Optional (first, last) step, or "first,last", of each final fit to capture a TensorFlow
+            profiler trace of
+        num_parallel_trials (int): Number of Hyperband trials run at the same time, in separate processes
+        distributed_queue (str): ClearML queue to run the searches' trials on as tasks ("local" for this process)
+        warm_start (bool): Search only around the best hyperparameters of the previous published models
+        dataset_id (str): ID of the packed dataset, to fetch an exact version instead of the latest by name
+
+    Returns:
+        IDs of the trained models, in the order of the backbones
+    """
+    from clearml import Task
+
+    specs = [get_backbone(backbone) for backbone in backbones]
+    # Task arguments may arrive as strings
+    profile_steps = profile_step_range(profile_steps)
+
+    task = Task.init(project_name=project_name, task_name="Co-located Train Models")
+    logger = task.get_logger()
+    phases = []
+
+    with track_phase("download", logger, phases):
+        data = load_training_data(dataset_name, dataset_id=dataset_id)
+
+    with track_phase("features", logger, phases):
+        if use_feature_cache:
+            backbone_inputs = backbone_features(specs, data)
+        else:
+            backbone_inputs = [(None, None)] * len(specs)
+
+    model_ids = []
+    for spec, (extractor, features) in zip(specs, backbone_inputs):
+        print(f"Training {spec['display_name']}...")
+        model, best_hps = fit_backbone(
+            spec,
+            data,
+            logger,
+            extractor,
+            features,
+            report_prefix=f"{spec['display_name']} ",
+            phases=phases,
+            profile_steps=profile_steps,
+            num_parallel_trials=num_parallel_trials,
+            distributed_queue=distributed_queue,
+            warm_start=warm_start,
+        )
+        with track_phase(f"{spec['display_name']} save", logger, phases):
+            model_ids.append(publish_model(task, model, spec, best_hps.values))
+
+    report_phases(task, phases)
+    return model_ids
@@ -0,0 +1,146 @@
+def training_profiler(logger=None, report_prefix="", profile_steps=None, profile_dir="profile"):
+    """
+    Create a Keras callback that splits each epoch's training time into waiting for input and computing.
+
+    Keras pulls tf.data batches inside the train step, so the callback cannot see the input wait on its own. Wrap
+    the training dataset with the callback's wrap() method: it stamps the time each batch becomes ready, and a
+    step waited for input for as long as its batch became ready after the step began. Per epoch, the input wait,
+    the compute time, steps/sec and images/sec are reported next to the loss and accuracy scalars.
+
+    Copies of the callback (e.g. made by keras_tuner for every trial) share its state, so the reports of all fits
+    form one timeline.
+
+    Example:
+        profiler = training_profiler(logger)
+        model.fit(profiler.wrap(train_dataset), epochs=10, callbacks=[profiler])
+
+    Args:
+        logger: ClearML logger to report to. None to only print.
+        report_prefix (str): Prefix of the reported scalar titles.
+        profile_steps (tuple): Optional (first, last) training step, counted across fits, to capture a TensorFlow
+            profiler trace of.
+        profile_dir (str): Directory of the profiler trace, uploaded as the "profile" artifact of the current task.
+
+    Returns:
+        Keras callback.
+    """
+    import time
+    from collections import deque
+    import tensorflow as tf
+    from keras.callbacks import Callback
+
+    class TrainingProfiler(Callback):
+        def __init__(self, state=None):
+            super().__init__()
+            # Shared between copies: ready batches in production order, and the step and epoch counters
+            self.state = state if state is not None else {
+                "ready": deque(), "step": 0, "epoch": 0, "profiling": False}
+
+        def __deepcopy__(self, memo):
+            # The logger and the ready-batch queue cannot (and must not) be copied
+            return TrainingProfiler(self.state)
+
+        def wrap(self, dataset):
+            def mark_ready(batch_size):
+                self.state["ready"].append((time.perf_counter(), int(batch_size)))
+                return 0
+
+            def stamp(images, labels):
+                ready = tf.py_function(mark_ready, [tf.shape(images)[0]], tf.int32)
+                with tf.control_dependencies([ready]):
+                    return tf.identity(images), tf.identity(labels)
+
+            # Stamp batches as they leave the existing pipeline, and keep them flowing through a new prefetch
+            return dataset.map(stamp).prefetch(tf.data.AUTOTUNE)
+
+        def on_epoch_begin(self, epoch, logs=None):
+            self.input_wait, self.compute, self.steps, self.images = 0.0, 0.0, 0, 0
+            self.epoch_start = None
+
+        def on_train_batch_begin(self, batch, logs=None):
+            if profile_steps and self.state["step"] == profile_steps[0] and not self.state["profiling"]:
+                tf.profiler.experimental.start(profile_dir)
+                self.state["profiling"] = True
+
+            self.step_start = time.perf_counter()
+            if self.epoch_start is None:
+                self.epoch_start = self.step_start
+
+        def on_train_batch_end(self, batch, logs=None):
+            step_end = time.perf_counter()
+            step_time = step_end - self.step_start
+
+            # Unwrapped datasets leave no stamps; their wait then counts as compute
+            ready_time, batch_size = self.state["ready"].popleft() if self.state["ready"] else (self.step_start, 0)
+            wait = min(max(ready_time - self.step_start, 0.0), step_time)
+            self.input_wait += wait
+            self.compute += step_time - wait
+            self.steps += 1
+            self.images += batch_size
+            self.epoch_end = step_end
+
+            if self.state["profiling"] and self.state["step"] >= profile_steps[1]:
+                self.stop_profiler()
+            self.state["step"] += 1
+
+        def on_epoch_end(self, epoch, logs=None):
+            if not self.steps:
+                return
+
+            train_time = self.epoch_end - self.epoch_start
+            results = {
+                "input wait": self.input_wait,
+                "compute": self.compute,
+                "steps_per_sec": self.steps / train_time,
+                "images_per_sec": self.images / train_time,
+            }
+            print(f" - input wait {self.input_wait:.1f}s, compute {self.compute:.1f}s, "
+                  f"{results['steps_per_sec']:.2f} steps/s, {results['images_per_sec']:.1f} images/s")
+
+            if logger is not None:
+                iteration = self.state["epoch"]
+                logger.report_scalar(f"{report_prefix}step time (s)", "input wait", iteration=iteration,
+                                     value=results["input wait"])
+                logger.report_scalar(f"{report_prefix}step time (s)", "compute", iteration=iteration,
+                                     value=results["compute"])
+                logger.report_scalar(f"{report_prefix}steps_per_sec", "train", iteration=iteration,
+                                     value=results["steps_per_sec"])
+                logger.report_scalar(f"{report_prefix}images_per_sec", "train", iteration=iteration,
+                                     value=results["images_per_sec"])
+            self.state["epoch"] += 1
+
+        def on_train_end(self, logs=None):
+            if self.state["profiling"]:
+                self.stop_profiler()
+
+        def stop_profiler(self):
+            from clearml import Task
+
+            tf.profiler.experimental.stop()
+            self.state["profiling"] = False
+            print(f"Profiler trace saved to {profile_dir}")
+            if Task.current_task() is not None:
+                Task.current_task().upload_artifact("profile", artifact_object=profile_dir)
+
+    return TrainingProfiler()
+
+
+def profile_step_range(profile_steps):
+    """
+    Parse the step range of a profiler trace, as given to a step function or on the command line.
+
+    Args:
+        profile_steps: (first, last) pair, a "first,last" string, or None, "" or "None" for no trace.
+
+    Returns:
+        Tuple of (first, last) step, or None.
+    """
+    if profile_steps in (None, "", "None"):
+        return None
+    if isinstance(profile_steps, str):
+        profile_steps = profile_steps.strip("()[] ").split(",")
+
+    first, last = (int(step) for step in profile_steps)
+    if first > last:
+        raise ValueError(f"Invalid profile steps: {first} is after {last}")
+    return first, last
@@ -0,0 +1,143 @@
+def trial_pruner(history_path, logger=None, report_prefix="", min_trials=3, grace_epochs=1):
+    """
+    Create a Keras callback that stops a search trial whose val_accuracy falls below the median of the other trials.
+
+    After every epoch, the trial's val_accuracy is compared with the val_accuracy of the finished trials at the same
+    epoch, and the trial is stopped if it is below their median (median stopping). Each trial's per-epoch
+    val_accuracy and the epoch it was pruned at are kept in a JSON file, so trials of the same search in other
+    processes (e.g. the workers of parallel_search) prune against each other, and a resumed search keeps its history.
+
+    Copies of the callback (e.g. made by keras_tuner for every trial) share its state.
+
+    Args:
+        history_path (str): JSON file of the trial history, e.g. in the search's tuner directory.
+        logger: ClearML logger to report the pruning decisions to. None to only print.
+        report_prefix (str): Prefix of the reported titles.
+        min_trials (int): Smallest number of finished trials at an epoch to compare with.
+        grace_epochs (int): Number of first epochs of a trial that are never pruned.
+
+    Returns:
+        Keras callback.
+    """
+    import statistics
+    import uuid
+    from keras.callbacks import Callback
+
+    class TrialPruner(Callback):
+        def __init__(self, state=None):
+            super().__init__()
+            # Shared between copies: the number of trials started and pruned by this process
+            self.state = state if state is not None else {"trials": 0, "pruned": 0}
+
+        def __deepcopy__(self, memo):
+            # The logger cannot (and must not) be copied
+            return TrialPruner(self.state)
+
+        def on_train_begin(self, logs=None):
+            # Unique across processes and resumed searches
+            self.trial_id = uuid.uuid4().hex[:8]
+            self.val_accuracy = {}
+            self.pruned_at = None
+            self.state["trials"] += 1
+
+        def on_epoch_end(self, epoch, logs=None):
+            if not logs or "val_accuracy" not in logs:
+                return
+            self.val_accuracy[str(epoch)] = float(logs["val_accuracy"])
+            if epoch < grace_epochs:
+                return
+
+            # Fits resumed by Hyperband count their epochs on from where they stopped, so epochs line up
+            finished = [
+                trial["val_accuracy"][str(epoch)]
+                for trial in update_trial_history(history_path).values()
+                if str(epoch) in trial["val_accuracy"]
+            ]
+            if len(finished) < min_trials:
+                return
+
+            median = statistics.median(finished)
+            if logs["val_accuracy"] < median:
+                self.model.stop_training = True
+                self.pruned_at = epoch
+                self.state["pruned"] += 1
+
+                message = (f"Pruned trial {self.trial_id} at epoch {epoch}: val_accuracy {logs['val_accuracy']:.4f} "
+                           f"below the median {median:.4f} of {len(finished)} trials")
+                print(message)
+                if logger is not None:
+                    logger.report_text(f"{report_prefix}{message}")
+                    logger.report_scalar(f"{report_prefix}trial pruning", "pruned trials",
+                                         iteration=self.state["trials"], value=self.state["pruned"])
+
+        def on_train_end(self, logs=None):
+            if self.val_accuracy:
+                update_trial_history(
+                    history_path, self.trial_id, {"val_accuracy": self.val_accuracy, "pruned_at": self.pruned_at})
+
+    return TrialPruner()
+
+
+def update_trial_history(history_path, trial_id=None, trial=None):
+    """
+    Read the trial history of a search, adding a finished trial to it first if given.
+
+    The file is locked while it is read and written, so that concurrent trials do not lose each other's records.
+
+    Args:
+        history_path (str): JSON file of the trial history.
+        trial_id (str): ID of the finished trial.
+        trial (dict): Record of the finished trial: per-epoch val_accuracy and the epoch it was pruned at.
+
+    Returns:
+        Dict of trial ID to trial record.
+    """
+    import fcntl
+    import json
+    import os
+
+    os.makedirs(os.path.dirname(history_path) or ".", exist_ok=True)
+    with open(history_path, "a+") as file:
+        fcntl.flock(file, fcntl.LOCK_EX)
+        file.seek(0)
+        content = file.read()
+        history = json.loads(content) if content else {}
+
+        if trial_id is not None:
+            history[trial_id] = trial
+            file.seek(0)
+            file.truncate()
+            json.dump(history, file)
+        fcntl.flock(file, fcntl.LOCK_UN)
+
+    return history
+
+
+def report_pruning(logger, history_path, report_prefix=""):
+    """
+    Report the trials of a search and the epochs they were pruned at as a table.
+
+    Args:
+        logger: ClearML logger to report to.
+        history_path (str): JSON file of the trial history.
+        report_prefix (str): Prefix of the table title.
+    """
+    import os
+
+    if not os.path.exists(history_path):
+        return
+
+    history = update_trial_history(history_path)
+    rows = [
+        [trial_id, len(trial["val_accuracy"]), max(trial["val_accuracy"].values()), trial["pruned_at"]]
+        for trial_id, trial in history.items()
+    ]
+    pruned = sum(trial["pruned_at"] is not None for trial in history.values())
+    print(f"Pruned {pruned} of {len(history)} trials.")
+
+    logger.report_table(
+        f"{report_prefix}Trial pruning",
+        "trials",
+        iteration=0,
+        table_plot=[["trial", "epochs", "best val_accuracy", "pruned at epoch"]] + rows,
+    )
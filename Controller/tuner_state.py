@@ -0,0 +1,109 @@
+from distributed_tuning import search_space
+
+
+def tuner_state_key(spec, dataset_id, hypermodel):
+    """
+    Get the key of a tuner's state: the backbone, the dataset version and a hash of the search space.
+
+    A search is only resumed from state with the same key, so a new dataset version or a changed search space starts
+    a new search, while unrelated code changes do not.
+
+    Args:
+        spec (dict): Backbone returned by get_backbone.
+        dataset_id (str): ID of the (packed) dataset version the search runs on.
+        hypermodel: keras_tuner HyperModel of the search.
+
+    Returns:
+        Key string, usable as a keras_tuner project name and a ClearML tag.
+    """
+    import hashlib
+    import json
+
+    space_config = json.dumps([hp.get_config() for hp in search_space(hypermodel).space], sort_keys=True, default=str)
+    space_hash = hashlib.sha256(space_config.encode()).hexdigest()[:12]
+
+    features = "features-" if getattr(hypermodel, "feature_shape", None) else ""
+    return f"tuner-{spec['key']}-{features}{dataset_id}-{space_hash}"
+
+
+def restore_tuner_state(key, project_dir, project_name):
+    """
+    Restore a tuner's state from the latest ClearML task that saved it, unless it is present locally.
+
+    Args:
+        key (str): Key returned by tuner_state_key.
+        project_dir (str): keras_tuner project directory of the tuner.
+        project_name (str): Name of the ClearML project.
+
+    Returns:
+        True if there is state to resume from.
+    """
+    import os
+    import shutil
+    from clearml import Task
+
+    if os.path.exists(os.path.join(project_dir, "oracle.json")):
+        print(f"Resuming the search from the local tuner state in {project_dir}.")
+        return True
+
+    tasks = [task for task in Task.get_tasks(project_name=project_name, tags=[key]) if key in task.artifacts]
+    if not tasks:
+        print(f"No saved tuner state for {key}, starting a new search.")
+        return False
+
+    latest = max(tasks, key=lambda task: task.data.last_update)
+    print(f"Resuming the search from the tuner state saved by task {latest.id}.")
+    shutil.copytree(latest.artifacts[key].get_local_copy(), project_dir, dirs_exist_ok=True)
+    return True
+
+
+def save_tuner_state(key, project_dir):
+    """
+    Save a tuner's state (oracle and trials) as an artifact of the current ClearML task, tagged with its key.
+
+    Args:
+        key (str): Key returned by tuner_state_key.
+        project_dir (str): keras_tuner project directory of the tuner.
+    """
+    import os
+    from clearml import Task
+
+    task = Task.current_task()
+    if task is None or not os.path.exists(project_dir):
+        return
+
+    task.add_tags([key])
+    task.upload_artifact(key, artifact_object=project_dir)
+
+
+def tuner_state_saver(key, project_dir, interval=600):
+    """
+    Create a Keras callback that saves the tuner state after a trial's fit, at most once per interval.
+
+    Copies of the callback (e.g. made by keras_tuner for every trial) share the time of the last save.
+
+    Args:
+        key (str): Key returned by tuner_state_key.
+        project_dir (str): keras_tuner project directory of the tuner.
+        interval (float): Smallest number of seconds between saves.
+
+    Returns:
+        Keras callback.
+    """
+    import time
+    from keras.callbacks import Callback
+
+    class TunerStateSaver(Callback):
+        def __init__(self, state=None):
+            super().__init__()
+            self.state = state if state is not None else {"last_save": time.monotonic()}
+
+        def __deepcopy__(self, memo):
+            return TunerStateSaver(self.state)
+
+        def on_train_end(self, logs=None):
+            if time.monotonic() - self.state["last_save"] >= interval:
+                save_tuner_state(key, project_dir)
+                self.state["last_save"] = time.monotonic()
+
+    return TunerStateSaver()
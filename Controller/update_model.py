@@ -1,11 +1,19 @@
 def update_repository(repo_path, branch_name, commit_message, project_name, model_id, repo_url, deploy_key_path):
+    import json
     import os
+    import shutil
     from clearml import Task
     from git import Repo, GitCommandError
-    from keras.models import load_model, save_model
 
     task = Task.init(project_name=project_name, task_name="Update Model Weights in GitHub Repository")
 
+    # Models now take raw [0, 255] pixels and rescale them in the graph, while the app's model.h5 expects pixels
+    # scaled to [0, 1]. Push them under a versioned name with their input contract, and leave model.h5 to the app
+    # versions that still scale the pixels themselves.
+    model_file_name = "model_v2.h5"
+    model_info_name = "model_v2.json"
+    model_info = {"model_id": model_id, "input_range": [0, 255], "input_dtype": "float32", "rescaling": "in model"}
+
     def get_model(model_id):
         from clearml import InputModel
 
@@ -13,10 +21,10 @@ def update_repository(repo_path, branch_name, commit_message, project_name, mode
         input_model.connect(task=task)
         local_model = input_model.get_local_copy()
 
-        model = load_model(local_model)
-        save_model(model, "model.h5")
+        # The published file is already a Keras .h5 model, so copy it as is
+        shutil.copyfile(local_model, model_file_name)
 
-        return "model.h5"
+        return model_file_name
 
     def configure_ssh_key(deploy_key_path):
         os.environ["GIT_SSH_COMMAND"] = f"ssh -i {deploy_key_path} -o IdentitiesOnly=yes"
@@ -40,13 +48,13 @@ def update_repository(repo_path, branch_name, commit_message, project_name, mode
     def archive_existing_model(repo):
         import datetime
 
-        model_file = os.path.join(repo.working_tree_dir, "model.h5")
+        model_file = os.path.join(repo.working_tree_dir, model_file_name)
         if os.path.exists(model_file):
             archive_dir = os.path.join(repo.working_tree_dir, "archive")
             os.makedirs(archive_dir, exist_ok=True)
             today = datetime.date.today().strftime("%Y%m%d")
             current_time = datetime.datetime.now().strftime("%H%M%S")
-            archived_model_file = os.path.join(archive_dir, f"model-{today}-{current_time}.h5")
+            archived_model_file = os.path.join(archive_dir, f"model_v2-{today}-{current_time}.h5")
             os.rename(model_file, archived_model_file)
             return archived_model_file
         return None
@@ -55,11 +63,17 @@ def update_repository(repo_path, branch_name, commit_message, project_name, mode
         import shutil
 
         archived_model_file = archive_existing_model(repo)
-        target_model_path = os.path.join(repo.working_tree_dir, "model.h5")
+        target_model_path = os.path.join(repo.working_tree_dir, model_file_name)
         shutil.move(model_path, target_model_path)
+
+        # Record the input contract next to the model, so the app can check it before feeding images
+        model_info_path = os.path.join(repo.working_tree_dir, model_info_name)
+        with open(model_info_path, "w") as file:
+            json.dump(model_info, file, indent=1)
+
         if archived_model_file:
             repo.index.add([archived_model_file])
-        repo.index.add([target_model_path])
+        repo.index.add([target_model_path, model_info_path])
 
     def commit_and_push(repo, branch, commit_message):
         try:
@@ -1,3 +1,6 @@
+from instrumentation import track_phase, report_phases
+
+
 def upload_dataset(project_name, dataset_name):
     """
     Upload dataset to a ClearML project.
@@ -14,11 +17,12 @@ def upload_dataset(project_name, dataset_name):
     from clearml import Task, Dataset
 
     task = Task.init(project_name=project_name, task_name="Upload Raw Data")
+    phases = []
 
     dataset_dir = "./Dataset/TomatoDiseaseDatasetV2"
 
     # Check if dataset already exists on ClearML
-    existing_dataset = Dataset.get(dataset_name=dataset_name)
+    existing_dataset = Dataset.get(dataset_name=dataset_name, only_completed=True)
     if existing_dataset:
         print(f"Dataset '{dataset_name}' already exists in project '{project_name}'.")
 
@@ -27,14 +31,17 @@ def upload_dataset(project_name, dataset_name):
     # Create a ClearML dataset
     dataset = Dataset.create(dataset_name=dataset_name, dataset_project=project_name)
 
-    # Add the dataset directory to the dataset
-    dataset.add_files(dataset_dir)
+    with track_phase("upload", task.get_logger(), phases) as phase:
+        # Add the dataset directory to the dataset
+        phase["items"] = dataset.add_files(dataset_dir)
+
+        # Upload the dataset to ClearML
+        dataset.upload()
 
-    # Upload the dataset to ClearML
-    dataset.upload()
+        # Finalize the dataset
+        dataset.finalize()
 
-    # Finalize the dataset
-    dataset.finalize()
+    report_phases(task, phases)
 
     # # Remove the dataset directory
     # shutil.rmtree(dataset_dir)
@@ -0,0 +1,95 @@
+from distributed_tuning import search_space, sample_configurations
+
+
+def previous_best_hyperparameters(spec, project_name):
+    """
+    Fetch the best hyperparameters of the latest published model of a backbone.
+
+    They are stored by publish_model as an artifact of the task that trained the model.
+
+    Args:
+        spec (dict): Backbone returned by get_backbone.
+        project_name (str): Name of the ClearML project.
+
+    Returns:
+        Dict of hyperparameter values, or None if there is no previous model with them.
+    """
+    from clearml import Model, Task
+
+    # Model names are matched as patterns, so leave out the exported variants (e.g. "_tflite")
+    models = [
+        model
+        for model in Model.query_models(
+            project_name=project_name, model_name=spec["model_name"], only_published=True, max_results=20)
+        if model.name == spec["model_name"]
+    ]
+    if not models:
+        return None
+
+    artifact = Task.get_task(task_id=models[0].task).artifacts.get(f"{spec['model_name']}_hyperparameters")
+    if artifact is None:
+        return None
+
+    values = artifact.get()
+    print(f"Best hyperparameters of the previous {spec['display_name']} model: {values}")
+    return values
+
+
+def narrowed_hyperparameters(hypermodel, values):
+    """
+    Narrow a hypermodel's search space around given values, with the values as defaults.
+
+    Integers and linear floats keep one step either side of their value, log-sampled floats a factor of 3 either
+    side, and choices are fixed to their value. Hyperparameters without a value in the current range (e.g. after the
+    search space changed) keep their full range.
+
+    Args:
+        hypermodel: keras_tuner HyperModel.
+        values (dict): Hyperparameter values to centre the space on.
+
+    Returns:
+        keras_tuner HyperParameters.
+    """
+    from keras_tuner import HyperParameters
+
+    narrowed = HyperParameters()
+    for hp in search_space(hypermodel).space:
+        value = values.get(hp.name)
+        kind = type(hp).__name__
+
+        if kind in ("Int", "Float") and value is not None and hp.min_value <= value <= hp.max_value:
+            if kind == "Int":
+                step = hp.step or 1
+                narrowed.Int(hp.name, max(hp.min_value, value - step), min(hp.max_value, value + step), step=step,
+                             default=value)
+            elif hp.sampling == "log":
+                narrowed.Float(hp.name, max(hp.min_value, value / 3), min(hp.max_value, value * 3), sampling="log",
+                               default=value)
+            else:
+                step = hp.step or (hp.max_value - hp.min_value) / 10
+                narrowed.Float(hp.name, max(hp.min_value, value - step), min(hp.max_value, value + step),
+                               step=hp.step, default=value)
+        elif (kind == "Choice" and value in hp.values) or (kind == "Boolean" and value is not None):
+            narrowed.Fixed(hp.name, value)
+        else:
+            narrowed.merge([hp])
+
+    return narrowed
+
+
+def warm_start_configurations(hypermodel, values, num_configs=9, seed=42):
+    """
+    Get the configurations of a warm-started search: the given values, then random draws around them.
+
+    Args:
+        hypermodel: keras_tuner HyperModel.
+        values (dict): Hyperparameter values to start from, e.g. from previous_best_hyperparameters.
+        num_configs (int): Number of configurations, including the given one.
+        seed (int): Seed of the draws.
+
+    Returns:
+        List of dicts of hyperparameter values.
+    """
+    narrowed = narrowed_hyperparameters(hypermodel, values)
+    start = {hp.name: narrowed.get(hp.name) for hp in narrowed.space}
+    return [start] + sample_configurations(hypermodel, num_configs - 1, seed, hyperparameters=narrowed)